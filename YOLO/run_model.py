@@ -1,5 +1,34 @@
-from ultralytics import YOLO
+import os
+import sys
+import time
+import argparse
 
-model = YOLO('runs/detect/train4/weights/last.pt')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
-results = model.predict("image3.jpg", save=True, conf=0.4, save_txt=True, save_conf=True)
+
+def main():
+    p = argparse.ArgumentParser(description="Run the YOLO layout model over a directory, glob or single image")
+    p.add_argument("source", nargs="?", default="image3.jpg", help="Image, directory or glob of pages")
+    p.add_argument("--weights", default="runs/detect/train4/weights/last.pt")
+    p.add_argument("--imgsz",   type=int, default=1024)
+    p.add_argument("--batch",   type=int, default=8, help="Pages per inference batch")
+    p.add_argument("--conf",    type=float, default=0.4)
+    p.add_argument("--device",  default="cpu")
+    p.add_argument("--backend", choices=("pt", "onnx", "openvino"), default="pt",
+                   help="Inference backend (onnx/openvino are exported next to the weights on first use)")
+    p.add_argument("--save_dir", help="Write label txt files and annotated images here")
+    args = p.parse_args()
+
+    from layout import LayoutRunner
+    runner = LayoutRunner(args.weights, imgsz=args.imgsz, batch=args.batch, conf=args.conf,
+                          device=args.device, backend=args.backend, save_dir=args.save_dir)
+    start = time.perf_counter()
+    for name, _, rows in runner.stream(args.source):
+        print(f"{os.path.basename(name)}: {len(rows)} regions")
+    wall = time.perf_counter() - start
+    print(f"{runner.images} images in {wall:.1f}s, {runner.rate():.1f} images/s in the model "
+          f"({runner.images / wall if wall else 0:.1f} images/s overall)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Accuracy vs. latency of the PyTorch, ONNX Runtime and OpenVINO backends on a held-out set.
+
+    python benchmarks/backend_report.py --equations heldout/eq --pages ../test --backends pt onnx openvino
+
+``--equations`` is a directory of equation crops, each with its ground-truth
+LaTeX in a ``.tex`` file of the same name. ``--pages`` is a YOLO dataset split
+(``images/`` + ``labels/``, e.g. the ``test`` split from ``YOLO/data.yaml``).
+Equations are scored by exact match and token edit similarity, pages by
+precision/recall of class-matched boxes at IoU 0.5. Results are printed as JSON.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import difflib
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layout
+from merging import LocalModels, DEFAULT_YOLO_WEIGHTS, IMAGE_EXTS
+
+
+def latency_stats(times):
+    times = np.asarray(times)
+    return {
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p95_ms": float(np.percentile(times, 95) * 1000),
+        "per_sec": float(len(times) / times.sum()) if times.sum() else 0.0,
+    }
+
+
+def tokens(latex):
+    return latex.replace("{", " { ").replace("}", " } ").split()
+
+
+def load_equations(directory):
+    samples = []
+    for fn in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(fn)
+        truth = os.path.join(directory, stem + ".tex")
+        if ext.lower() in IMAGE_EXTS and os.path.exists(truth):
+            with open(truth, encoding="utf-8") as f:
+                samples.append((Image.open(os.path.join(directory, fn)).convert("RGB"), f.read().strip()))
+    return samples
+
+
+def bench_equations(samples, backend, model_dir=None):
+    models = LocalModels(backend, model_dir)
+    models.latex([samples[0][0]])  # warm-up
+    times, exact, similarity = [], 0, []
+    for img, truth in samples:
+        start = time.perf_counter()
+        pred = models.latex([img])[0]
+        times.append(time.perf_counter() - start)
+        exact += tokens(pred) == tokens(truth)
+        similarity.append(difflib.SequenceMatcher(None, tokens(pred), tokens(truth)).ratio())
+    return {
+        "samples": len(samples),
+        "exact_match": exact / len(samples),
+        "token_similarity": float(np.mean(similarity)),
+        **latency_stats(times),
+    }
+
+
+def match(pred, truth, W, H, iou=0.5):
+    """True positives of class-matched greedy matching at ``iou``."""
+    if not len(pred) or not len(truth):
+        return 0
+    boxes = np.vstack([layout.to_pixel_boxes(pred, W, H), layout.to_pixel_boxes(truth, W, H)])
+    ious = layout.overlaps(boxes)[0][:len(pred), len(pred):]
+    ious[pred[:, 0][:, None] != truth[:, 0][None, :]] = 0
+    tp = 0
+    for i in np.argsort(-pred[:, 5]):
+        j = ious[i].argmax()
+        if ious[i, j] >= iou:
+            tp += 1
+            ious[:, j] = 0
+    return tp
+
+
+def bench_pages(split_dir, backend, weights, imgsz, conf, int8):
+    runner = layout.LayoutRunner(weights, imgsz=imgsz, batch=1, conf=conf, backend=backend, int8=int8)
+    images_dir = os.path.join(split_dir, "images")
+    labels_dir = os.path.join(split_dir, "labels")
+    tp = n_pred = n_truth = 0
+    times, seen = [], 0.0
+    for name, img, rows in runner.stream(images_dir):
+        times.append(runner.seconds - seen)
+        seen = runner.seconds
+        label = os.path.join(labels_dir, os.path.splitext(os.path.basename(name))[0] + ".txt")
+        truth = layout.load_labels(label) if os.path.exists(label) else layout.EMPTY
+        H, W = img.shape[:2]
+        tp += match(rows, truth, W, H)
+        n_pred += len(rows)
+        n_truth += len(truth)
+    return {
+        "pages": runner.images,
+        "precision": tp / n_pred if n_pred else 0.0,
+        "recall": tp / n_truth if n_truth else 0.0,
+        **latency_stats(times[1:] or times),  # first page includes warm-up
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--equations", help="Directory of equation crops + .tex ground truth")
+    p.add_argument("--pages", help="YOLO dataset split with images/ and labels/")
+    p.add_argument("--backends", nargs="+", default=["pt", "onnx", "openvino"], choices=("pt", "onnx", "openvino"))
+    p.add_argument("--model_dir", help="Pix2Tex export directory (see cpu_models.py)")
+    p.add_argument("--yolo_weights", default=DEFAULT_YOLO_WEIGHTS)
+    p.add_argument("--imgsz", type=int, default=1024)
+    p.add_argument("--conf", type=float, default=0.4)
+    p.add_argument("--int8", action="store_true", help="Use the INT8 YOLO exports")
+    args = p.parse_args()
+    if not (args.equations or args.pages):
+        p.error("pass --equations and/or --pages")
+
+    report = {}
+    samples = load_equations(args.equations) if args.equations else []
+    for backend in args.backends:
+        row = {}
+        if samples:
+            row["equations"] = bench_equations(samples, backend, args.model_dir)
+        if args.pages:
+            row["pages"] = bench_pages(args.pages, backend, args.yolo_weights, args.imgsz, args.conf,
+                                       args.int8 and backend != "pt")
+        report[backend] = row
+        print(f"{backend}: done", file=sys.stderr)
+
+    if "pt" in report:
+        for backend, row in report.items():
+            for kind in ("equations", "pages"):
+                if kind in row and kind in report["pt"] and row[kind]["p50_ms"]:
+                    row[kind]["speedup_vs_pt"] = report["pt"][kind]["p50_ms"] / row[kind]["p50_ms"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
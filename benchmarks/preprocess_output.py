@@ -0,0 +1,75 @@
+"""Compare preprocessed-PDF encodings by size and upload time per page.
+
+    python benchmarks/preprocess_output.py scan.pdf --uplink_mbps 2
+    python benchmarks/preprocess_output.py scan.pdf --upload_url http://127.0.0.1:9000/v3/pdf
+
+Upload time is estimated from ``--uplink_mbps``; with ``--upload_url`` each
+output is also POSTed there (e.g. a local stub server) and the real time is
+reported. Results are printed as JSON.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipeline2"))
+
+from pdf2image import pdfinfo_from_path
+from preprocessing import preprocess_pdf
+
+VARIANTS = [
+    ("gray", None),
+    ("g4", None),
+    ("g4", 200),
+    ("g4", 150),
+]
+
+
+def timed_upload(url, path):
+    with open(path, "rb") as f:
+        data = f.read()
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/pdf"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req) as resp:
+        resp.read()
+    return time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("input_pdf")
+    p.add_argument("--dpi", type=int, default=300)
+    p.add_argument("--uplink_mbps", type=float, default=2.0, help="Uplink bandwidth for the estimate")
+    p.add_argument("--upload_url", help="Also POST each output here and time it")
+    args = p.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for mode, target_dpi in VARIANTS:
+            out = os.path.join(tmpdir, f"{mode}_{target_dpi or args.dpi}.pdf")
+            start = time.perf_counter()
+            preprocess_pdf(args.input_pdf, out, dpi=args.dpi, mode=mode, target_dpi=target_dpi)
+            elapsed = time.perf_counter() - start
+            pages = pdfinfo_from_path(out)["Pages"]
+            size = os.path.getsize(out)
+            row = {
+                "mode": mode,
+                "dpi": target_dpi or args.dpi,
+                "pages": pages,
+                "bytes": size,
+                "bytes_per_page": size / pages,
+                "preprocess_s": elapsed,
+                "est_upload_s_per_page": size * 8 / (args.uplink_mbps * 1e6) / pages,
+            }
+            if args.upload_url:
+                row["upload_s_per_page"] = timed_upload(args.upload_url, out) / pages
+            results.append(row)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
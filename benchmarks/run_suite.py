@@ -0,0 +1,283 @@
+"""Offline throughput benchmark for merging.py and pipeline2, stage by stage.
+
+    python benchmarks/run_suite.py --pages 20 --output bench.json
+    python benchmarks/run_suite.py --stages label_parsing proofreading --openai_latency 0.5
+
+A synthetic corpus (see ``synthetic.py``) is generated first, and Mathpix and
+OpenAI are replaced by the local stubs in ``stubs.py``. Each stage runs in its
+own fresh process so its peak RSS is its own, and reports pages/sec, p50/p95
+latency per unit (page, fragment or document run), peak RSS and the one-off
+setup time (imports, model loading, stub start) as JSON. Stages whose
+dependencies or models are missing are reported as skipped.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [HERE, ROOT, os.path.join(ROOT, "pipeline2")]
+
+from synthetic import make_corpus
+
+STAGES = ("preprocess", "detection", "label_parsing", "pix2tex", "tesseract",
+          "mathpix", "proofreading", "packaging")
+
+
+class Skip(Exception):
+    pass
+
+
+def _pages(corpus):
+    pages_dir = os.path.join(corpus, "pages")
+    return [os.path.join(pages_dir, f) for f in sorted(os.listdir(pages_dir))]
+
+
+def _labels(page):
+    corpus = os.path.dirname(os.path.dirname(page))
+    return os.path.join(corpus, "labels", os.path.splitext(os.path.basename(page))[0] + ".txt")
+
+
+def _crops(cls):
+    """Per page: the crops of class ``cls``, cut with the ground-truth labels."""
+    import cv2
+    from merging import load_yolo, page_crops
+
+    def page_of(page):
+        img = cv2.imread(page)
+        H, W = img.shape[:2]
+        dets = [d for d in load_yolo(_labels(page), W, H) if d["class"] == cls]
+        return page_crops(img, dets)
+    return page_of
+
+
+def stage_preprocess(corpus, work, cfg):
+    from preprocessing import preprocess_pdf
+    latencies = []
+    for i in range(cfg["repeat"]):
+        start = time.perf_counter()
+        preprocess_pdf(os.path.join(corpus, "document.pdf"), os.path.join(work, f"pre_{i}.pdf"), dpi=cfg["dpi"])
+        latencies.append(time.perf_counter() - start)
+    return latencies, cfg["pages"] * cfg["repeat"], "document"
+
+
+def stage_detection(corpus, work, cfg):
+    import layout
+    from merging import DEFAULT_YOLO_WEIGHTS
+    weights = cfg["yolo_weights"] or DEFAULT_YOLO_WEIGHTS
+    if not os.path.isfile(weights):
+        raise Skip(f"no YOLO weights at {weights}")
+    runner = layout.LayoutRunner(weights, imgsz=cfg["imgsz"], batch=cfg["batch"], backend=cfg["backend"])
+    latencies, seen = [], 0.0
+    for _ in runner.stream(os.path.join(corpus, "pages")):
+        latencies.append(runner.seconds - seen)
+        seen = runner.seconds
+    return latencies, len(latencies), "page"
+
+
+def stage_label_parsing(corpus, work, cfg):
+    import layout
+    from PIL import Image
+    pages = _pages(corpus)
+    sizes = [Image.open(p).size for p in pages]
+    latencies = []
+    for _ in range(cfg["repeat"] * 20):
+        for page, (W, H) in zip(pages, sizes):
+            start = time.perf_counter()
+            layout.to_dets(layout.load_labels(_labels(page)), W, H)
+            latencies.append(time.perf_counter() - start)
+    return latencies, len(latencies), "page"
+
+
+def _recognize(corpus, cls, recognize):
+    crops_of = _crops(cls)
+    latencies = []
+    for page in _pages(corpus):
+        crops = crops_of(page)
+        start = time.perf_counter()
+        recognize(crops)
+        latencies.append(time.perf_counter() - start)
+    return latencies, len(latencies), "page"
+
+
+def stage_pix2tex(corpus, work, cfg):
+    from merging import LocalModels
+    models = LocalModels(cfg["backend"])
+    return _recognize(corpus, 0, lambda crops: models.latex(crops, cfg["batch"]))
+
+
+def stage_tesseract(corpus, work, cfg):
+    import pytesseract
+    from merging import ocr_text
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        raise Skip("tesseract binary not found")
+    return _recognize(corpus, 1, lambda crops: [ocr_text(c) for c in crops])
+
+
+def stage_mathpix(corpus, work, cfg):
+    from stubs import mathpix_stub
+    from mathpix import mathpix_pdf_to_tex_zip
+    with open(os.path.join(corpus, "document.tex"), encoding="utf-8") as f:
+        tex = f.read()
+    latencies = []
+    with mathpix_stub(tex, cfg["mathpix_latency"], cfg["mathpix_per_page"]) as stub:
+        for i in range(cfg["repeat"]):
+            start = time.perf_counter()
+            mathpix_pdf_to_tex_zip(os.path.join(corpus, "document.pdf"), "stub", "stub",
+                                   os.path.join(work, f"mathpix_{i}.zip"), url=stub.url + "/v3/pdf")
+            latencies.append(time.perf_counter() - start)
+    return latencies, cfg["pages"] * cfg["repeat"], "document"
+
+
+def stage_proofreading(corpus, work, cfg):
+    from stubs import openai_stub
+    os.environ["OPENAI_API_KEY"] = "stub"
+    import tracing
+    import llm_proofread
+    tracer = tracing.start_job("benchmark")
+    with openai_stub(cfg["openai_latency"], cfg["openai_per_token"], cfg["openai_runaway"]) as stub:
+        start = time.perf_counter()
+        for i in range(cfg["repeat"]):
+            llm_proofread.main(os.path.join(corpus, "document.tex"), concurrency=cfg["concurrency"],
+                               rpm=10 ** 6, tpm=10 ** 9, base_url=stub.url + "/v1", use_cache=False,
+                               output_path=os.path.join(work, f"corrected_{i}.tex"))
+        wall = time.perf_counter() - start
+    latencies = [e["latency_s"] for e in tracer.events if e["name"] == "fragment"]
+    return latencies, cfg["pages"] * cfg["repeat"], "fragment", wall
+
+
+def stage_packaging(corpus, work, cfg):
+    out = os.path.join(work, "output")
+    shutil.copytree(os.path.join(corpus, "pages"), os.path.join(out, "doc", "images"))
+    shutil.copy(os.path.join(corpus, "document.tex"), os.path.join(out, "doc", "doc.tex"))
+    latencies = []
+    for i in range(cfg["repeat"]):
+        start = time.perf_counter()
+        shutil.make_archive(os.path.join(work, f"package_{i}"), "zip", root_dir=out)
+        latencies.append(time.perf_counter() - start)
+    return latencies, cfg["pages"] * cfg["repeat"], "document"
+
+
+def run_stage(name, corpus, cfg):
+    """Run one stage in this (fresh) process; returns its raw measurements."""
+    os.dup2(2, 1)  # stage output goes to stderr, stdout is kept for the report
+    work = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    os.chdir(work)  # llm_proofread logs to the CWD
+    try:
+        start = time.perf_counter()
+        latencies, pages, unit, *wall = globals()["stage_" + name](corpus, work, cfg)
+        total = time.perf_counter() - start
+    except Skip as e:
+        return {"skipped": str(e)}
+    except ImportError as e:
+        return {"skipped": f"missing dependency: {e.name or e}"}
+    finally:
+        os.chdir(HERE)
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        "unit": unit,
+        "pages": pages,
+        # concurrent stages measure their own wall time; sequential ones are the sum of their units
+        "wall_s": wall[0] if wall else sum(latencies),
+        "setup_s": total - (wall[0] if wall else sum(latencies)),
+        "latencies": latencies,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def summarize(raw):
+    if "latencies" not in raw:
+        return raw
+    lat = np.asarray(raw.pop("latencies"))
+    raw["units"] = len(lat)
+    raw["pages_per_s"] = raw["pages"] / raw["wall_s"] if raw["wall_s"] else 0.0
+    raw["p50_ms"] = float(np.percentile(lat, 50) * 1000) if len(lat) else None
+    raw["p95_ms"] = float(np.percentile(lat, 95) * 1000) if len(lat) else None
+    return raw
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    p.add_argument("--pages", type=int, default=10, help="Synthetic pages to generate")
+    p.add_argument("--columns", type=int, nargs="+", default=[1, 2])
+    p.add_argument("--dpi", type=int, default=150, help="Corpus / preprocessing DPI")
+    p.add_argument("--corpus", help="Reuse a corpus directory from synthetic.py")
+    p.add_argument("--repeat", type=int, default=1, help="Runs of the whole-document stages")
+    p.add_argument("--batch", type=int, default=8, help="YOLO / Pix2Tex batch size")
+    p.add_argument("--imgsz", type=int, default=1024)
+    p.add_argument("--backend", choices=("pt", "onnx", "openvino"), default="pt")
+    p.add_argument("--yolo_weights")
+    p.add_argument("--concurrency", type=int, default=8, help="Proofreading concurrency")
+    p.add_argument("--mathpix_latency", type=float, default=1.0, help="Stub seconds per conversion")
+    p.add_argument("--mathpix_per_page", type=float, default=0.1, help="Stub seconds per page")
+    p.add_argument("--openai_latency", type=float, default=0.2, help="Stub seconds per request")
+    p.add_argument("--openai_per_token", type=float, default=0.001, help="Stub seconds per output token")
+    p.add_argument("--openai_runaway", type=float, default=0.0, help="Fraction of runaway stub completions")
+    p.add_argument("--output", help="Also write the JSON report here")
+    args = p.parse_args()
+
+    tmp = None
+    if args.corpus:
+        corpus = os.path.abspath(args.corpus)
+        with open(os.path.join(corpus, "corpus.json")) as f:
+            manifest = json.load(f)
+    else:
+        tmp = tempfile.mkdtemp(prefix="bench_corpus_")
+        corpus = tmp
+        manifest = make_corpus(corpus, args.pages, args.columns, args.dpi)
+
+    cfg = {k: v for k, v in vars(args).items() if k not in ("stages", "corpus", "output", "columns")}
+    cfg["pages"] = manifest["pages"]
+    report = {
+        "meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "cpus": os.cpu_count(), "machine": platform.machine()},
+        "config": cfg,
+        "corpus": manifest,
+        "stages": {},
+    }
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        for name in args.stages:
+            print(f"[{name}] running...", file=sys.stderr)
+            with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                try:
+                    raw = pool.submit(run_stage, name, corpus, cfg).result()
+                except Exception as e:
+                    raw = {"error": f"{type(e).__name__}: {e}"}
+            report["stages"][name] = summarize(raw)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+
+
+if __name__ == "__main__":
+    main()
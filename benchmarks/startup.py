@@ -0,0 +1,92 @@
+"""Import time of the CLI entry points, checked against a budget.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget my_budget.json --repeat 10 --json
+
+Every entry point in the budget file is started as ``python -X importtime
+<script> <args>`` (``--help`` by default, which should return before any heavy
+dependency is loaded) and the cumulative time of the imports it triggers is
+compared with its ``import_ms``. Modules the bare interpreter imports anyway
+(``python -c pass``) are not counted. The best of ``--repeat`` runs is used.
+An entry can also give the exit code it expects, e.g. 2 for an argument error.
+Exits with status 1 if any entry point is over budget, listing its heaviest
+top-level imports.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DEFAULT_BUDGET = os.path.join(HERE, "startup_budget.json")
+
+
+def import_times(argv, cwd=ROOT):
+    """Top-level imports of ``python -X importtime argv`` as {module: cumulative ms}, and the exit code."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *argv], cwd=cwd,
+                          capture_output=True, text=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if name.startswith(" ") and not name.startswith("  ") and cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1000
+    return times, proc.returncode
+
+
+def measure(script, args, baseline, repeat=5):
+    """Best-of-``repeat`` import ms of ``script args`` and its top-level imports from that run."""
+    path = os.path.join(ROOT, script)
+    best, best_times, code = None, {}, 0
+    for _ in range(repeat):
+        times, code = import_times([path, *args], cwd=os.path.dirname(path))
+        times = {m: ms for m, ms in times.items() if m not in baseline}
+        total = sum(times.values())
+        if best is None or total < best:
+            best, best_times = total, times
+    return best, best_times, code
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--budget", default=DEFAULT_BUDGET, help="Budget file (JSON)")
+    p.add_argument("--repeat", type=int, default=5, help="Runs per entry point; the fastest counts")
+    p.add_argument("--top", type=int, default=5, help="Heaviest imports to list for entries over budget")
+    p.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = p.parse_args()
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+    baseline = set(import_times(["-c", "pass"])[0])
+
+    results, over = [], 0
+    for entry in budget["entry_points"]:
+        entry_args = entry.get("args", ["--help"])
+        ms, times, code = measure(entry["script"], entry_args, baseline, args.repeat)
+        ok = ms <= entry["import_ms"] and code == entry.get("exit_code", 0)
+        over += not ok
+        heaviest = sorted(times.items(), key=lambda kv: -kv[1])[:args.top]
+        results.append({"script": entry["script"], "args": entry_args, "import_ms": round(ms, 1),
+                        "budget_ms": entry["import_ms"], "exit_code": code, "ok": ok,
+                        "heaviest": {m: round(t, 1) for m, t in heaviest}})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            status = "ok  " if r["ok"] else "OVER"
+            line = f"{status} {r['script']} {' '.join(r['args'])}: {r['import_ms']:.1f} / {r['budget_ms']} ms"
+            if r["exit_code"]:
+                line += f" (exit {r['exit_code']})"
+            print(line)
+            if not r["ok"]:
+                for m, t in r["heaviest"].items():
+                    print(f"       {t:8.1f} ms  {m}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Local stand-ins for the Mathpix and OpenAI APIs with configurable latency.
+
+    python benchmarks/stubs.py --tex corpus/document.tex --mathpix_latency 2 --openai_latency 0.3
+
+Mathpix: ``POST /v3/pdf`` accepts the upload, ``GET /v3/pdf/<id>`` reports
+``processing`` until ``latency + per_page * pages`` seconds have passed, and
+``GET /v3/pdf/<id>.tex`` returns a zip with ``--tex`` in Mathpix's layout.
+OpenAI: ``POST /v1/chat/completions`` echoes the fragment after the prompt,
+after ``latency + per_token * output tokens`` seconds; with ``stream`` the
+tokens are sent as server-sent events, ``per_token`` apart. A ``runaway``
+fraction of completions keeps repeating the fragment until ``max_tokens``.
+"""
+import io
+import re
+import json
+import time
+import uuid
+import random
+import zipfile
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config = {}
+
+    def _reply(self, code, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class MathpixHandler(StubHandler):
+    jobs = {}
+
+    def do_POST(self):
+        data = self._body()
+        pages = max(1, len(re.findall(rb"/Type\s*/Page[^s]", data)))
+        pdf_id = uuid.uuid4().hex[:12]
+        self.jobs[pdf_id] = time.time() + self.config["latency"] + self.config["per_page"] * pages
+        self._reply(200, {"pdf_id": pdf_id})
+
+    def do_GET(self):
+        m = re.fullmatch(r"/v3/pdf/(\w+)(\.tex)?", self.path)
+        if not m or m.group(1) not in self.jobs:
+            self._reply(404, {"error": "unknown pdf_id"})
+        elif time.time() < self.jobs[m.group(1)]:
+            self._reply(200, {"status": "processing"})
+        elif not m.group(2):
+            self._reply(200, {"status": "completed"})
+        else:
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w") as zf:
+                zf.writestr(f"{m.group(1)}/{m.group(1)}.tex", self.config["tex"])
+                zf.writestr(f"{m.group(1)}/images/", "")
+            self._reply(200, buf.getvalue(), "application/zip")
+
+
+class OpenAIHandler(StubHandler):
+    def do_POST(self):
+        req = json.loads(self._body().decode("utf-8"))
+        prompt = req["messages"][-1]["content"]
+        text = prompt.split(":\n", 1)[-1]
+        finish_reason = "stop"
+        if random.random() < self.config.get("runaway", 0.0):
+            max_chars = 4 * req.get("max_tokens", 2048)
+            text = ((text + "\n\n") * (max_chars // (len(text) + 2) + 1))[:max_chars]
+            finish_reason = "length"
+        completion = len(text) // 4 + 1
+        usage = {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": completion,
+                 "total_tokens": len(prompt) // 4 + completion + 1}
+        head = {"id": "chatcmpl-" + uuid.uuid4().hex[:12], "created": int(time.time()),
+                "model": req.get("model", "stub")}
+        if req.get("stream"):
+            self._stream(req, head, text, finish_reason, usage)
+            return
+        time.sleep(self.config["latency"] + self.config["per_token"] * completion)
+        self._reply(200, {
+            **head,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+    def _stream(self, req, head, text, finish_reason, usage):
+        def chunk(delta, finish=None, **extra):
+            return {**head, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if delta is not None else [],
+                    **extra}
+
+        time.sleep(self.config["latency"])
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        events = [chunk({"role": "assistant", "content": ""})]
+        events += [chunk({"content": text[i:i + 4]}) for i in range(0, len(text), 4)]
+        events.append(chunk({}, finish_reason))
+        if (req.get("stream_options") or {}).get("include_usage"):
+            events.append(chunk(None, usage=usage))
+        try:
+            for event in events:
+                self.wfile.write(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+                time.sleep(self.config["per_token"])
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client aborted the stream
+
+
+class StubServer:
+    """Run a stub handler on a free localhost port in a background thread."""
+
+    def __init__(self, handler, **config):
+        self.handler = type(handler.__name__, (handler,), {"config": config, "jobs": {}})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def mathpix_stub(tex, latency=1.0, per_page=0.0):
+    """Mathpix stub; its API URL is ``stub.url + "/v3/pdf"``."""
+    return StubServer(MathpixHandler, tex=tex, latency=latency, per_page=per_page)
+
+
+def openai_stub(latency=0.2, per_token=0.0, runaway=0.0):
+    """OpenAI stub; its base URL is ``stub.url + "/v1"``."""
+    return StubServer(OpenAIHandler, latency=latency, per_token=per_token, runaway=runaway)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--tex", required=True, help="LaTeX the Mathpix stub returns")
+    p.add_argument("--mathpix_latency", type=float, default=1.0)
+    p.add_argument("--mathpix_per_page", type=float, default=0.0)
+    p.add_argument("--openai_latency", type=float, default=0.2)
+    p.add_argument("--openai_per_token", type=float, default=0.0)
+    p.add_argument("--openai_runaway", type=float, default=0.0, help="Fraction of runaway completions")
+    args = p.parse_args()
+
+    with open(args.tex, encoding="utf-8") as f:
+        tex = f.read()
+    with mathpix_stub(tex, args.mathpix_latency, args.mathpix_per_page) as mathpix, \
+         openai_stub(args.openai_latency, args.openai_per_token, args.openai_runaway) as openai:
+        print(f"MATHPIX_API_URL={mathpix.url}/v3/pdf")
+        print(f"OPENAI_BASE_URL={openai.url}/v1")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
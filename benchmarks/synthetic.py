@@ -0,0 +1,171 @@
+"""Synthetic page corpus with known layouts.
+
+    python benchmarks/synthetic.py corpus/ --pages 20 --columns 2
+
+Writes ``pages/page_NNN.png`` with YOLO ground truth in ``labels/`` (class 0
+equation, 1 text, 2 figure, as in merging.py), the same pages as
+``document.pdf``, and ``document.tex``: a Mathpix-style LaTeX version of the
+text and equations, with a few typos so the proofreading stage has work.
+"""
+import os
+import json
+import random
+import argparse
+
+from PIL import Image, ImageDraw, ImageFont
+
+WORDS = ("the of and a to in is that for it as was with be by on not this are which from or have an "
+         "function value equation system matrix vector energy field particle wave solution boundary "
+         "condition integral derivative limit series theorem proof method result problem model linear "
+         "constant variable space time order first second given where then we obtain follows").split()
+EQUATIONS = ("E = m c^2", "a^2 + b^2 = c^2", "f(x) = sum a_n x^n", "int_0^1 x dx = 1/2",
+             "F = q (E + v x B)", "lim x->0 sin(x)/x = 1", "det(A - l I) = 0", "dS >= dQ / T")
+EQ_LATEX = (r"E = m c^{2}", r"a^{2} + b^{2} = c^{2}", r"f(x) = \sum_{n} a_{n} x^{n}",
+            r"\int_{0}^{1} x \, d x = \frac{1}{2}", r"F = q(E + v \times B)",
+            r"\lim_{x \to 0} \frac{\sin x}{x} = 1", r"\det(A - \lambda I) = 0", r"d S \geq \frac{d Q}{T}")
+
+
+def load_font(size):
+    for name in ("DejaVuSans.ttf", "LiberationSans-Regular.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    return ImageFont.load_default(size=size)
+
+
+def typo(word, rng):
+    if len(word) > 3:
+        i = rng.randrange(1, len(word) - 1)
+        return word[:i] + word[i + 1:]
+    return word
+
+
+def paragraph(rng, n_words):
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+
+def wrap(draw, text, font, width):
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and draw.textlength(candidate, font=font) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return lines + [line] if line else lines
+
+
+def make_page(rng, W, H, columns, font, eq_font):
+    """Draw one page; returns (image, rows, blocks) with YOLO rows and (kind, payload) blocks in order."""
+    img = Image.new("L", (W, H), 255)
+    draw = ImageDraw.Draw(img)
+    margin, gutter = W // 12, W // 20
+    col_w = (W - 2 * margin - (columns - 1) * gutter) // columns
+    line_h = int(font.size * 1.4)
+    rows, blocks = [], []
+
+    def add(cls, x1, y1, x2, y2):
+        rows.append((cls, (x1 + x2) / 2 / W, (y1 + y2) / 2 / H, (x2 - x1) / W, (y2 - y1) / H, 1.0))
+
+    for col in range(columns):
+        x = margin + col * (col_w + gutter)
+        y = margin
+        while True:
+            kind = rng.choices(("text", "equation", "figure"), weights=(6, 2, 1))[0]
+            if kind == "text":
+                text = paragraph(rng, rng.randint(25, 70))
+                lines = wrap(draw, text, font, col_w)
+                h = len(lines) * line_h
+                if y + h > H - margin:
+                    break
+                for i, line in enumerate(lines):
+                    draw.text((x, y + i * line_h), line, fill=0, font=font)
+                add(1, x, y, x + col_w, y + h)
+                blocks.append(("text", text))
+            elif kind == "equation":
+                k = rng.randrange(len(EQUATIONS))
+                w = int(draw.textlength(EQUATIONS[k], font=eq_font))
+                h = int(eq_font.size * 1.5)
+                if y + h > H - margin:
+                    break
+                ex = x + (col_w - w) // 2
+                draw.text((ex, y), EQUATIONS[k], fill=0, font=eq_font)
+                add(0, ex, y, ex + w, y + h)
+                blocks.append(("equation", EQ_LATEX[k]))
+            else:
+                h = rng.randint(col_w // 4, col_w // 2)
+                if y + h > H - margin:
+                    break
+                draw.rectangle((x, y, x + col_w, y + h), outline=0, width=3)
+                for _ in range(rng.randint(2, 6)):
+                    r = rng.randint(10, h // 3)
+                    cx, cy = rng.randint(x + r, x + col_w - r), rng.randint(y + r, y + h - r)
+                    draw.ellipse((cx - r, cy - r, cx + r, cy + r), outline=0, width=2)
+                add(2, x, y, x + col_w, y + h)
+                blocks.append(("figure", None))
+            y += h + line_h
+    return img, rows, blocks
+
+
+def to_tex(blocks, rng, typo_rate=0.05):
+    body, n_fig = [], 0
+    for kind, payload in blocks:
+        if kind == "text":
+            body.append(" ".join(typo(w, rng) if rng.random() < typo_rate else w for w in payload.split()))
+        elif kind == "equation":
+            body.append(f"$$\n{payload}\n$$")
+        else:
+            n_fig += 1
+            body.append(f"\\begin{{center}}\n\\includegraphics[width=\\textwidth]{{fig_{n_fig:03d}}}\n\\end{{center}}")
+    return ("\\documentclass[10pt]{article}\n\\usepackage{amsmath}\n\\usepackage{graphicx}\n"
+            "\\begin{document}\n" + "\n\n".join(body) + "\n\\end{document}\n")
+
+
+def make_corpus(out_dir, pages=10, columns=(1, 2), dpi=150, seed=0):
+    """Generate the corpus in ``out_dir`` and return its manifest dict."""
+    rng = random.Random(seed)
+    W, H = int(8.27 * dpi), int(11.69 * dpi)
+    font, eq_font = load_font(max(10, dpi // 8)), load_font(max(12, dpi // 6))
+    os.makedirs(os.path.join(out_dir, "pages"), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, "labels"), exist_ok=True)
+
+    images, all_blocks, counts = [], [], {"text": 0, "equation": 0, "figure": 0}
+    for n in range(pages):
+        img, rows, blocks = make_page(rng, W, H, columns[n % len(columns)], font, eq_font)
+        img.save(os.path.join(out_dir, "pages", f"page_{n:03d}.png"))
+        with open(os.path.join(out_dir, "labels", f"page_{n:03d}.txt"), "w") as f:
+            for row in rows:
+                f.write(f"{row[0]} " + " ".join(f"{v:.6f}" for v in row[1:]) + "\n")
+        images.append(img)
+        all_blocks.extend(blocks)
+        for kind, _ in blocks:
+            counts[kind] += 1
+
+    images[0].save(os.path.join(out_dir, "document.pdf"), save_all=True, append_images=images[1:],
+                   resolution=dpi)
+    with open(os.path.join(out_dir, "document.tex"), "w", encoding="utf-8") as f:
+        f.write(to_tex(all_blocks, rng))
+    manifest = {"pages": pages, "columns": list(columns), "dpi": dpi, "size": [W, H], "seed": seed,
+                "regions": counts}
+    with open(os.path.join(out_dir, "corpus.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("out_dir")
+    p.add_argument("--pages", type=int, default=10)
+    p.add_argument("--columns", type=int, nargs="+", default=[1, 2], help="Columns per page, cycled")
+    p.add_argument("--dpi", type=int, default=150)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+    print(json.dumps(make_corpus(args.out_dir, args.pages, args.columns, args.dpi, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
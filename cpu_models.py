@@ -0,0 +1,185 @@
+"""Pix2Tex exported to ONNX for CPU inference with ONNX Runtime or OpenVINO.
+
+    python cpu_models.py --pix2tex --int8                  # -> LaTeX-OCR/onnx/
+    python cpu_models.py --yolo --format openvino --int8   # next to the YOLO weights
+
+The encoder, one decoder step and the image resizer are exported separately;
+the autoregressive loop stays in Python, doing the same top-k sampling as
+pix2tex. ``ExportedLatexOCR`` exposes the attributes of ``LatexOCR`` that
+``merging.pix2tex_batch`` uses, so preprocessing, batching and decoding of
+the output are shared with the PyTorch path.
+"""
+import os
+import json
+import shutil
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EXPORT_DIR = os.path.join(HERE, "LaTeX-OCR", "onnx")
+# pix2tex's generate(): top_k with filter_thres=0.9
+FILTER_THRES = 0.9
+ARG_KEYS = ("max_dimensions", "min_dimensions", "no_resize", "bos_token", "eos_token", "pad_token",
+            "max_seq_len", "temperature")
+
+
+def quantize(path):
+    """Dynamic INT8 weight quantization of an ONNX file, in place."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    tmp = path + ".int8"
+    quantize_dynamic(path, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, path)
+
+
+def load_session(path, backend="onnx", threads=None):
+    """A callable ``feed dict -> first output`` running ``path`` on CPU."""
+    if backend == "onnx":
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        sess = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        return lambda feed: sess.run(None, feed)[0]
+    if backend == "openvino":
+        import openvino as ov
+        core = ov.Core()
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        compiled = core.compile_model(core.read_model(path), "CPU", config)
+        return lambda feed: compiled(feed)[0]
+    raise ValueError(f"unknown backend {backend!r}")
+
+
+def export_pix2tex(out_dir=DEFAULT_EXPORT_DIR, int8=False, opset=17):
+    import torch
+    from pix2tex.cli import LatexOCR
+
+    class DecoderStep(torch.nn.Module):
+        """Logits of the next token, as the decoder computes them inside generate()."""
+
+        def __init__(self, net):
+            super().__init__()
+            self.net = net
+
+        def forward(self, tokens, memory):
+            return self.net(tokens, context=memory)[:, -1, :]
+
+    m = LatexOCR()
+    args = m.args
+    os.makedirs(out_dir, exist_ok=True)
+    x = torch.randn(1, 1, 64, 320)
+    with torch.no_grad():
+        encoder = m.model.encoder.eval()
+        torch.onnx.export(encoder, x, os.path.join(out_dir, "encoder.onnx"), opset_version=opset,
+                          input_names=["image"], output_names=["memory"],
+                          dynamic_axes={"image": {0: "batch", 2: "height", 3: "width"},
+                                        "memory": {0: "batch", 1: "patches"}})
+        memory = encoder(x)
+        tokens = torch.full((1, 4), args.bos_token, dtype=torch.long)
+        torch.onnx.export(DecoderStep(m.model.decoder.net).eval(), (tokens, memory),
+                          os.path.join(out_dir, "decoder.onnx"), opset_version=opset,
+                          input_names=["tokens", "memory"], output_names=["logits"],
+                          dynamic_axes={"tokens": {0: "batch", 1: "length"},
+                                        "memory": {0: "batch", 1: "patches"},
+                                        "logits": {0: "batch"}})
+        if m.image_resizer is not None:
+            torch.onnx.export(m.image_resizer.eval(), x, os.path.join(out_dir, "resizer.onnx"),
+                              opset_version=opset, input_names=["image"], output_names=["logits"],
+                              dynamic_axes={"image": {0: "batch", 2: "height", 3: "width"}})
+    if int8:
+        for name in ("encoder.onnx", "decoder.onnx"):
+            quantize(os.path.join(out_dir, name))
+
+    shutil.copy(args.tokenizer, os.path.join(out_dir, "tokenizer.json"))
+    config = {k: args[k] for k in ARG_KEYS if k in args}
+    config["int8"] = int8
+    with open(os.path.join(out_dir, "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    return out_dir
+
+
+def top_k(logits, thres=FILTER_THRES):
+    import numpy as np
+    k = max(1, int((1 - thres) * logits.shape[-1]))
+    cutoff = np.partition(logits, -k, axis=-1)[:, -k][:, None]
+    return np.where(logits < cutoff, -np.inf, logits)
+
+
+class _Resizer:
+    def __init__(self, run):
+        self.run = run
+
+    def __call__(self, t):
+        import torch
+        return torch.from_numpy(self.run({"image": t.cpu().numpy()}))
+
+
+class _Seq2Seq:
+    def __init__(self, args, encoder, decoder, seed=0):
+        import numpy as np
+        self.args = args
+        self.encoder = encoder
+        self.decoder = decoder
+        self.rng = np.random.default_rng(seed)
+
+    def generate(self, x, temperature=0.25):
+        import numpy as np
+        import torch
+        memory = self.encoder({"image": x.cpu().numpy()})
+        out = np.full((len(memory), 1), self.args.bos_token, dtype=np.int64)
+        for _ in range(self.args.max_seq_len):
+            logits = top_k(self.decoder({"tokens": out[:, -self.args.max_seq_len:], "memory": memory}))
+            if temperature < 1e-4:
+                sample = logits.argmax(-1)
+            else:
+                z = (logits - logits.max(-1, keepdims=True)) / temperature
+                probs = np.exp(z)
+                probs /= probs.sum(-1, keepdims=True)
+                sample = np.array([self.rng.choice(len(p), p=p) for p in probs])
+            out = np.concatenate([out, sample[:, None]], axis=1)
+            if (out == self.args.eos_token).any(axis=1).all():
+                break
+        return torch.from_numpy(out[:, 1:])
+
+
+class ExportedLatexOCR:
+    """Pix2Tex from ``export_pix2tex`` output, duck-typed for ``merging.pix2tex_batch``."""
+
+    def __init__(self, model_dir=DEFAULT_EXPORT_DIR, backend="onnx", threads=None):
+        from munch import Munch
+        from transformers import PreTrainedTokenizerFast
+
+        with open(os.path.join(model_dir, "config.json")) as f:
+            self.args = Munch(json.load(f))
+        self.args.device = "cpu"
+        self.args.setdefault("no_resize", False)
+        self.tokenizer = PreTrainedTokenizerFast(tokenizer_file=os.path.join(model_dir, "tokenizer.json"))
+        self.model = _Seq2Seq(self.args,
+                              load_session(os.path.join(model_dir, "encoder.onnx"), backend, threads),
+                              load_session(os.path.join(model_dir, "decoder.onnx"), backend, threads))
+        resizer = os.path.join(model_dir, "resizer.onnx")
+        self.image_resizer = _Resizer(load_session(resizer, backend, threads)) if os.path.exists(resizer) else None
+
+
+def main():
+    from merging import DEFAULT_YOLO_WEIGHTS
+
+    p = argparse.ArgumentParser(description="Export the layout and equation models for CPU inference")
+    p.add_argument("--pix2tex", action="store_true", help="Export the Pix2Tex encoder/decoder to ONNX")
+    p.add_argument("--yolo",    action="store_true", help="Export the YOLO layout weights")
+    p.add_argument("--format",  choices=("onnx", "openvino"), default="onnx", help="YOLO export format")
+    p.add_argument("--int8",    action="store_true", help="Quantize weights to INT8")
+    p.add_argument("--out_dir", default=DEFAULT_EXPORT_DIR, help="Pix2Tex export directory")
+    p.add_argument("--yolo_weights", default=DEFAULT_YOLO_WEIGHTS)
+    p.add_argument("--imgsz",   type=int, default=1024)
+    args = p.parse_args()
+    if not (args.pix2tex or args.yolo):
+        p.error("nothing to export: pass --pix2tex and/or --yolo")
+
+    if args.pix2tex:
+        print(f"Pix2Tex exported to {export_pix2tex(args.out_dir, args.int8)}")
+    if args.yolo:
+        from layout import export_model
+        print(f"YOLO exported to {export_model(args.yolo_weights, args.format, args.imgsz, args.int8)}")
+
+
+if __name__ == "__main__":
+    main()
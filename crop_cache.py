@@ -0,0 +1,166 @@
+"""Cache of recognized crops, keyed by what the crop looks like.
+
+Lecture notes repeat the same equations, headers and running footers on many
+pages, and Pix2Tex / Tesseract calls are the most expensive per-region step
+of merging.py. A crop is keyed by a normalized perceptual hash: grayscale,
+Otsu-binarized, trimmed to its ink so box jitter and margins don't matter,
+scaled down by a fixed factor and packed to bits. Scaling by a factor rather
+than to a fixed size keeps the glyphs legible, so two different formulas of
+the same shape don't collide. The model name, its version, the backend and
+a fingerprint of the weights are part of the key (for a model server, as its
+/health reports them), so switching models never returns stale results.
+
+Entries live in a bounded in-memory LRU in front of an SQLite file shared by
+all runs, which drops its least recently used entries past ``max_bytes``.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+DEFAULT_PATH = os.getenv(
+    "CROP_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "coursework2025", "crops.sqlite"),
+)
+MEMORY_ITEMS = 4096
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+HASH_SCALE = 0.5
+CLASS_NAMES = {0: "equation", 1: "text"}
+
+
+def model_tag(models, cls):
+    """Model, version, backend and weights that produce the result for class ``cls`` crops."""
+    info = models.describe()
+    versions = info.get("versions", {})
+    if cls == 0:
+        return f"pix2tex-{versions.get('pix2tex', 'unknown')}/{info['backend']}/{info['weights']}"
+    return f"tesseract-{versions.get('tesseract', 'unknown')}/rus+eng/psm6"
+
+
+def crop_hash(pil, scale=HASH_SCALE):
+    """Normalized perceptual hash of a crop, as a hex string."""
+    import cv2
+    gray = np.asarray(pil.convert("L"))
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    ys, xs = np.nonzero(ink)
+    if len(ys):
+        ink = ink[ys.min():ys.max() + 1, xs.min():xs.max() + 1]
+    h, w = ink.shape
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    small = cv2.resize(ink * 255, size, interpolation=cv2.INTER_AREA) >= 128
+    digest = hashlib.sha256(f"{size[0]}x{size[1]}:".encode("ascii"))
+    digest.update(np.packbits(small, axis=None).tobytes())
+    return digest.hexdigest()
+
+
+class CropCache:
+    """In-memory LRU of ``memory_items`` entries over a persistent SQLite store of up to ``max_bytes``."""
+
+    def __init__(self, path=DEFAULT_PATH, memory_items=MEMORY_ITEMS, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(crops)")]
+        if columns and "size" not in columns:
+            # stores from before the size cap are rebuilt
+            self.db.execute("DROP TABLE crops")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS crops ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS crops_last_used ON crops(last_used)")
+        self.db.commit()
+        # running size of the store; recounted only when it goes over max_bytes
+        self.total = self._size()
+
+    def _size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM crops").fetchone()[0]
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            row = self.db.execute("SELECT value FROM crops WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE crops SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        """Store ``(key, value)`` pairs in one transaction, then evict past ``max_bytes``."""
+        now = time.time()
+        with self.lock:
+            for key, value in items:
+                self._remember(key, value)
+                size = len(key) + len(value.encode("utf-8"))
+                old = self.db.execute("SELECT size FROM crops WHERE key = ?", (key,)).fetchone()
+                self.db.execute("INSERT OR REPLACE INTO crops (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                                (key, value, size, now))
+                self.total += size - (old[0] if old else 0)
+            if self.total > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        # other processes may share the store, so start from its real size
+        self.total = self._size()
+        if self.total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM crops ORDER BY last_used").fetchall():
+            self.db.execute("DELETE FROM crops WHERE key = ?", (key,))
+            self.total -= size
+            if self.total <= self.max_bytes:
+                break
+
+    def recognize(self, fn, crops, cls, tag):
+        """``fn(crops)`` with cached crops skipped; repeats within ``crops`` are recognized once."""
+        keys = [tag + ":" + crop_hash(c) for c in crops]
+        out = [self.get(k) for k in keys]
+        todo = {}
+        for i, (k, v) in enumerate(zip(keys, out)):
+            if v is None:
+                todo.setdefault(k, []).append(i)
+        name = CLASS_NAMES.get(cls, str(cls))
+        self.hits[name] += len(crops) - len(todo)
+        self.misses[name] += len(todo)
+        if todo:
+            results = fn([crops[idx[0]] for idx in todo.values()])
+            self.put_many(zip(todo, results))
+            for idx, value in zip(todo.values(), results):
+                for i in idx:
+                    out[i] = value
+        return out
+
+    def stats(self):
+        parts = []
+        for name in sorted(set(self.hits) | set(self.misses)):
+            total = self.hits[name] + self.misses[name]
+            rate = self.hits[name] / total if total else 0.0
+            parts.append(f"{name}: {self.hits[name]}/{total} cached ({rate:.0%})")
+        return ", ".join(parts) or "no crops"
+
+    def close(self):
+        with self.lock:
+            self.db.close()
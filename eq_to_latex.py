@@ -1,7 +1,6 @@
 import argparse
-import torch
-from PIL import Image
-from pix2tex.cli import LatexOCR
+
+import model_client
 
 
 def main():
@@ -10,6 +9,11 @@ def main():
     parser.add_argument("--checkpoint", type=str, help="Path to model checkpoint")
     parser.add_argument("--config", type=str, help="Path to config file")
     parser.add_argument("--temperature", type=float, default=1e-6, help="Sampling temperature")
+    parser.add_argument("--server", type=str, default=model_client.DEFAULT_URL, help="Model server URL (see model_server.py)")
+    parser.add_argument("--no_server", action="store_true", help="Always load Pix2Tex in-process")
+    parser.add_argument("--backend", choices=("pt", "onnx", "openvino"), default="pt",
+                        help="In-process backend; onnx/openvino need an export from cpu_models.py")
+    parser.add_argument("--model_dir", type=str, help="Pix2Tex export directory for --backend onnx/openvino")
 
     args = parser.parse_args()
 
@@ -18,10 +22,19 @@ def main():
         config=args.config,
         temperature=args.temperature,
     )
-    #model = LatexOCR(model_args)
-    model = LatexOCR()
+    from PIL import Image
     img = Image.open(args.image_path).convert("RGB")
-    latex_code = model(img)
+    models = None if args.no_server else model_client.connect(args.server)
+    if models is not None:
+        latex_code = models.latex([img])[0]
+    elif args.backend != "pt":
+        from merging import LocalModels
+        latex_code = LocalModels(args.backend, args.model_dir).latex([img])[0]
+    else:
+        from pix2tex.cli import LatexOCR
+        #model = LatexOCR(model_args)
+        model = LatexOCR()
+        latex_code = model(img)
     print(latex_code)
     return latex_code
 
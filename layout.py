@@ -0,0 +1,277 @@
+"""Layout detections as NumPy arrays.
+
+Rows are YOLO-txt style ``(cls, xc, yc, w, h, conf)`` with normalized
+coordinates, one per detection, stacked into an ``(N, 6)`` float array. The
+helpers here convert them to pixel boxes, drop low-confidence and duplicate
+regions, and order them for reading with a recursive XY-cut, so two-column
+pages come out column by column instead of interleaved. ``LayoutRunner``
+produces the rows straight from the YOLO model, batched and streamed.
+"""
+import os
+import time
+import warnings
+import itertools
+
+import numpy as np
+
+EMPTY = np.zeros((0, 6), dtype=np.float32)
+DATA_YAML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "YOLO", "data.yaml")
+
+
+def load_labels(txt_path):
+    """Read a YOLO label file (with or without the confidence column) into an (N, 6) array."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # empty label file = page without detections
+        rows = np.loadtxt(txt_path, dtype=np.float32, ndmin=2)
+    if rows.size == 0:
+        return EMPTY.copy()
+    if rows.shape[1] == 5:
+        rows = np.hstack([rows, np.ones((len(rows), 1), dtype=np.float32)])
+    return rows
+
+
+def from_result(result):
+    """Rows from an ultralytics ``Results`` object, without going through Python lists."""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return EMPTY.copy()
+    return np.column_stack([
+        boxes.cls.cpu().numpy(),
+        boxes.xywhn.cpu().numpy(),
+        boxes.conf.cpu().numpy(),
+    ]).astype(np.float32)
+
+
+def to_pixel_boxes(rows, W, H):
+    """(N, 4) int ``x1, y1, x2, y2`` boxes, clipped to the page."""
+    xc, yc, w, h = (rows[:, k].astype(np.float64) for k in range(1, 5))
+    boxes = np.stack([(xc - w / 2) * W, (yc - h / 2) * H, (xc + w / 2) * W, (yc + h / 2) * H], axis=1)
+    boxes = np.rint(boxes).astype(np.int64)
+    np.clip(boxes[:, 0::2], 0, W, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, H, out=boxes[:, 1::2])
+    return boxes
+
+
+def overlaps(boxes):
+    """Pairwise IoU and intersection-over-smaller-area matrices of (N, 4) boxes."""
+    boxes = boxes.astype(np.float64)
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area[:, None] + area[None, :] - inter
+    smaller = np.minimum(area[:, None], area[None, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(union > 0, inter / union, 0.0)
+        contained = np.where(smaller > 0, inter / smaller, 0.0)
+    return iou, contained
+
+
+def dedupe(rows, boxes, iou=0.6, contain=0.9):
+    """Indices of the regions kept after NMS.
+
+    A region is dropped if a more confident one of any class overlaps it by
+    more than ``iou``, which catches the same paragraph detected as both
+    text and equation. A region more than ``contain`` inside a larger one of
+    the same class is dropped as well, whatever the confidences: the larger
+    box already covers it. An equation inside a text paragraph is kept.
+    """
+    order = np.argsort(-rows[:, 5], kind="stable")
+    iou_m, contain_m = overlaps(boxes)
+    alive = np.ones(len(rows), dtype=bool)
+    keep = []
+    for i in order:
+        if not alive[i]:
+            continue
+        keep.append(i)
+        alive &= ~(iou_m[i] > iou)
+    keep = np.array(keep, dtype=np.int64)
+    area = (boxes[keep, 2] - boxes[keep, 0]) * (boxes[keep, 3] - boxes[keep, 1])
+    keep = keep[np.argsort(-area, kind="stable")]
+    inside = (contain_m[np.ix_(keep, keep)] > contain) & (rows[keep, 0][:, None] == rows[keep, 0][None, :])
+    alive = np.ones(len(keep), dtype=bool)
+    for k in range(len(keep)):
+        if alive[k]:
+            alive[k + 1:] &= ~inside[k, k + 1:]
+    return np.sort(keep[alive])
+
+
+def _gaps(lo, hi, min_gap):
+    """Cut positions between the merged ``[lo, hi)`` intervals, as (position, width) pairs."""
+    order = np.argsort(lo, kind="stable")
+    lo, hi = lo[order], hi[order]
+    reach = np.maximum.accumulate(hi)[:-1]
+    width = lo[1:] - reach
+    at = np.nonzero(width > min_gap)[0]
+    return reach[at] + width[at] / 2, width[at]
+
+
+def xy_cut(boxes, min_gap=0):
+    """Reading order of (N, 4) boxes by recursive XY-cut.
+
+    A block with an empty vertical gap running through all of it is split
+    into columns at the widest such gap (left part first). Otherwise it is
+    split into rows at every horizontal gap, and consecutive rows that share
+    a column gutter are read as one block, so two columns come out column by
+    column even when their paragraph gaps line up. Blocks that cannot be
+    split are read top to bottom, left to right.
+    """
+    out = []
+
+    def has_column_gap(idx):
+        return len(_gaps(boxes[idx, 0], boxes[idx, 2], min_gap)[0]) > 0
+
+    def cut(idx):
+        if len(idx) <= 1:
+            out.extend(idx.tolist())
+            return
+        b = boxes[idx]
+        xs, xw = _gaps(b[:, 0], b[:, 2], min_gap)
+        if len(xs):
+            first = (b[:, 0] + b[:, 2]) / 2 < xs[np.argmax(xw)]
+            cut(idx[first])
+            cut(idx[~first])
+            return
+        ys, _ = _gaps(b[:, 1], b[:, 3], min_gap)
+        if not len(ys):
+            out.extend(idx[np.lexsort((b[:, 0], b[:, 1]))].tolist())
+            return
+        band = np.searchsorted(ys, (b[:, 1] + b[:, 3]) / 2)
+        bands = [idx[band == k] for k in range(len(ys) + 1)]
+        start = 0
+        while start < len(bands):
+            end = start + 1
+            while end < len(bands) and has_column_gap(np.concatenate(bands[start:end + 1])):
+                end += 1
+            cut(np.concatenate(bands[start:end]))
+            start = end
+
+    cut(np.arange(len(boxes)))
+    return np.array(out, dtype=np.int64)
+
+
+def to_dets(rows, W, H, conf=0.0, iou=0.6, contain=0.9):
+    """Pixel detections in reading order, as the dicts merging.py works with."""
+    rows = np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+    rows = rows[rows[:, 5] >= conf]
+    if not len(rows):
+        return []
+    boxes = to_pixel_boxes(rows, W, H)
+    # zero-area boxes (clipped away or degenerate) give empty crops
+    valid = np.nonzero((boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1]))[0]
+    rows, boxes = rows[valid], boxes[valid]
+    keep = dedupe(rows, boxes, iou, contain)
+    rows, boxes = rows[keep], boxes[keep]
+    order = xy_cut(boxes)
+    return [{
+        "class": int(rows[i, 0]),
+        "bbox": tuple(int(v) for v in boxes[i]),
+        "xc": float(rows[i, 1]), "yc": float(rows[i, 2]),
+        "conf": float(rows[i, 5]),
+    } for i in order]
+
+
+def save_labels(path, rows):
+    """Write rows as a YOLO label file with the confidence column (``save_conf`` format)."""
+    with open(path, "w") as f:
+        for cls, xc, yc, w, h, conf in rows.tolist():
+            f.write(f"{int(cls)} {xc:.6f} {yc:.6f} {w:.6f} {h:.6f} {conf:.6f}\n")
+
+
+def export_model(weights, fmt, imgsz=1024, int8=False):
+    """Export YOLO ``weights`` to ``onnx`` / ``openvino`` once and return the exported model path.
+
+    The export lives next to the weights (ultralytics' naming) and is reused
+    until the weights file is newer than it. With ``int8`` the ONNX model gets
+    dynamic INT8 weight quantization; OpenVINO uses ultralytics' INT8 export,
+    calibrated on the dataset in ``YOLO/data.yaml``.
+    """
+    from ultralytics import YOLO
+    stem = os.path.splitext(weights)[0]
+    if fmt == "onnx":
+        target = stem + (".int8.onnx" if int8 else ".onnx")
+    else:
+        target = stem + ("_int8_openvino_model" if int8 else "_openvino_model")
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights):
+        return target
+    if fmt == "openvino" and int8:
+        return YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True, int8=True, data=DATA_YAML)
+    path = YOLO(weights).export(format=fmt, imgsz=imgsz, dynamic=True)
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(path, target, weight_type=QuantType.QInt8)
+        return target
+    return path
+
+
+class LayoutRunner:
+    """Batched, streaming YOLO layout inference on CPU.
+
+    ``stream(pages)`` takes a directory, a glob or an iterable of BGR arrays
+    and yields ``(name, image, rows)`` per page as each batch finishes, where
+    ``rows`` is the (N, 6) array the rest of this module works with. Nothing
+    is written to disk unless ``save_dir`` is given (label txt + annotated
+    image per page). ``backend`` is ``pt`` (ultralytics/torch), ``onnx`` or
+    ``openvino``, optionally ``int8`` quantized.
+    """
+
+    def __init__(self, weights, imgsz=1024, batch=8, conf=0.4, device="cpu", backend="pt", save_dir=None,
+                 int8=False):
+        from ultralytics import YOLO
+        if backend != "pt":
+            weights = export_model(weights, backend, imgsz, int8)
+        self.model = YOLO(weights, task="detect")
+        self.imgsz = imgsz
+        self.batch = max(1, batch)
+        self.conf = conf
+        self.device = device
+        self.save_dir = save_dir
+        self.images = 0
+        self.seconds = 0.0
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+    def _predict(self, source, batch):
+        return self.model.predict(source, stream=True, batch=batch, imgsz=self.imgsz, conf=self.conf,
+                                  device=self.device, verbose=False)
+
+    def _timed(self, results):
+        start = time.perf_counter()
+        for r in results:
+            self.seconds += time.perf_counter() - start
+            self.images += 1
+            yield r
+            start = time.perf_counter()
+
+    def _emit(self, name, r):
+        rows = from_result(r)
+        if self.save_dir:
+            import cv2
+            stem = os.path.splitext(os.path.basename(str(name)))[0]
+            save_labels(os.path.join(self.save_dir, stem + ".txt"), rows)
+            cv2.imwrite(os.path.join(self.save_dir, stem + ".jpg"), r.plot())
+        return name, r.orig_img, rows
+
+    def stream(self, pages):
+        if isinstance(pages, str):
+            for r in self._timed(self._predict(pages, self.batch)):
+                yield self._emit(r.path, r)
+            return
+        chunk, n = [], 0
+        for page in itertools.chain(pages, [None]):
+            if page is not None:
+                chunk.append(page)
+                if len(chunk) < self.batch:
+                    continue
+            if not chunk:
+                break
+            for r in self._timed(self._predict(chunk, len(chunk))):
+                yield self._emit(f"page{n:04d}", r)
+                n += 1
+            chunk = []
+
+    def rate(self):
+        """Images per second of model time so far."""
+        return self.images / self.seconds if self.seconds else 0.0
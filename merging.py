@@ -1,11 +1,12 @@
 import os
-import cv2
 import argparse
-import torch
-from PIL import Image
-import pytesseract
-from pix2tex.cli import LatexOCR
 import re
+import queue
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+import model_client
 
 custom_preamble = r"""\documentclass[10pt]{article}
 \usepackage{ucharclasses}
@@ -15,6 +16,7 @@ custom_preamble = r"""\documentclass[10pt]{article}
 \usepackage{bbold}
 \usepackage{graphicx}
 \usepackage[export]{adjustbox}
+\csname endofdump\endcsname
 \usepackage{polyglossia}
 \usepackage{fontspec}
 \IfFontExistsTF{CMU Serif}
@@ -26,23 +28,20 @@ custom_preamble = r"""\documentclass[10pt]{article}
 \graphicspath{{./images/}}
 """
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_YOLO_WEIGHTS = os.path.join(HERE, "YOLO", "runs", "detect", "train4", "weights", "last.pt")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
 
 def load_yolo(txt_path, W, H):
-    dets = []
-    with open(txt_path) as f:
-        for line in f:
-            cls, xc, yc, w, h, conf = map(float, line.split())
-            x1 = int((xc - w/2) * W)
-            y1 = int((yc - h/2) * H)
-            x2 = int((xc + w/2) * W)
-            y2 = int((yc + h/2) * H)
-            dets.append({
-                "class": int(cls),
-                "bbox": (x1,y1,x2,y2),
-                "xc": xc, "yc": yc
-            })
-    dets.sort(key=lambda d: (int(d["yc"]*H//50), d["xc"]*W))
-    return dets
+    import layout
+    return layout.to_dets(layout.load_labels(txt_path), W, H)
+
+
+def rows_to_dets(rows, W, H):
+    """YOLO rows ``(cls, xc, yc, w, h, conf)`` -> de-duplicated pixel detections in reading order."""
+    import layout
+    return layout.to_dets(rows, W, H)
 
 
 def balance_braces(latex: str) -> str:
@@ -61,63 +60,385 @@ def strip_array_env(latex: str) -> str:
     return latex
 
 
+def pix2tex_tensor(model, img):
+    """Preprocess one crop exactly like ``LatexOCR.__call__`` and return the input tensor."""
+    import numpy as np
+    import torch
+    from PIL import Image
+    from pix2tex.cli import minmax_size
+    from pix2tex.dataset.transforms import test_transform
+    from pix2tex.utils import pad
+
+    img = minmax_size(pad(img), model.args.max_dimensions, model.args.min_dimensions)
+    if model.image_resizer is not None and not model.args.no_resize:
+        with torch.no_grad():
+            input_image = img.convert('RGB').copy()
+            r, w, h = 1, input_image.size[0], input_image.size[1]
+            for _ in range(10):
+                h = int(h * r)
+                img = pad(minmax_size(input_image.resize((w, h), Image.Resampling.BILINEAR if r > 1 else Image.Resampling.LANCZOS),
+                                      model.args.max_dimensions, model.args.min_dimensions))
+                t = test_transform(image=np.array(img.convert('RGB')))['image'][:1].unsqueeze(0)
+                w = (model.image_resizer(t.to(model.args.device)).argmax(-1).item() + 1) * 32
+                if w == img.size[0]:
+                    break
+                r = w / img.size[0]
+    else:
+        img = np.array(pad(img).convert('RGB'))
+        t = test_transform(image=img)['image'][:1].unsqueeze(0)
+    return t
+
+
+def pix2tex_batch(model, images, batch_size=16):
+    """Recognize a list of PIL crops with batched encoder/decoder passes.
+
+    Crops are bucketed by their preprocessed tensor shape (pix2tex already pads
+    to multiples of 32), so every crop sees exactly the input it would get on
+    its own and the predictions match the one-by-one ``model(img)`` calls.
+    """
+    import torch
+    from pix2tex.utils import post_process, token2str
+
+    tensors = [pix2tex_tensor(model, im) for im in images]
+    buckets = {}
+    for i, t in enumerate(tensors):
+        buckets.setdefault(tuple(t.shape[-2:]), []).append(i)
+
+    eos = model.args.eos_token
+    temperature = model.args.get('temperature', .25)
+    results = [None] * len(images)
+    for idx in buckets.values():
+        for s in range(0, len(idx), batch_size):
+            chunk = idx[s:s + batch_size]
+            x = torch.cat([tensors[i] for i in chunk]).to(model.args.device)
+            dec = model.model.generate(x, temperature=temperature)
+            for i, seq in zip(chunk, dec):
+                # the decoder keeps sampling for finished rows until the whole
+                # batch has emitted EOS, so cut each row at its own first EOS
+                hits = (seq == eos).nonzero()
+                if len(hits):
+                    seq = seq[:hits[0].item() + 1]
+                results[i] = post_process(token2str(seq, model.tokenizer)[0])
+    return results
+
+
+def ocr_text(pil):
+    import pytesseract
+    return pytesseract.image_to_string(pil, lang="rus+eng", config="--psm 6")
+
+
+@lru_cache(maxsize=1)
+def model_versions():
+    """Installed Pix2Tex package and Tesseract binary versions."""
+    from importlib import metadata
+    versions = {}
+    try:
+        versions["pix2tex"] = metadata.version("pix2tex")
+    except metadata.PackageNotFoundError:
+        versions["pix2tex"] = "unknown"
+    try:
+        import pytesseract
+        versions["tesseract"] = str(pytesseract.get_tesseract_version())
+    except Exception:
+        versions["tesseract"] = "unknown"
+    return versions
+
+
+def weights_id(paths):
+    """Short fingerprint (name, size, mtime) of model files, so retrained or re-exported weights differ."""
+    import hashlib
+    h = hashlib.sha256()
+    for path in paths:
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{os.path.basename(path)}:{st.st_size}:{int(st.st_mtime)}\n".encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+class LocalModels:
+    """In-process Pix2Tex + Tesseract, used when no model server is running.
+
+    ``backend`` ``onnx`` / ``openvino`` runs the Pix2Tex export from
+    ``cpu_models.py`` instead of the PyTorch model.
+    """
+
+    def __init__(self, backend="pt", model_dir=None):
+        self.backend = backend
+        if backend == "pt":
+            from pix2tex.cli import LatexOCR
+            self.pix2tex = LatexOCR()
+            self.weights = weights_id([self.pix2tex.args.get("checkpoint")])
+        else:
+            from cpu_models import ExportedLatexOCR, DEFAULT_EXPORT_DIR
+            model_dir = model_dir or DEFAULT_EXPORT_DIR
+            self.pix2tex = ExportedLatexOCR(model_dir, backend)
+            self.weights = weights_id([os.path.join(model_dir, name)
+                                       for name in ("encoder.onnx", "decoder.onnx", "resizer.onnx")])
+
+    def describe(self):
+        """Backend, weights fingerprint and versions of the models (model_server's /health)."""
+        return {"backend": self.backend, "weights": self.weights, "versions": model_versions()}
+
+    def latex(self, images, batch_size=16):
+        return pix2tex_batch(self.pix2tex, images, batch_size)
+
+    def text(self, images):
+        return [ocr_text(im) for im in images]
+
+
+def equation_line(raw):
+    latex = balance_braces(strip_array_env(raw.strip()))
+    return fr"\\{balance_braces(latex)}\\"
+
+
+def figure_line(fn):
+    return (f"\\begin{{figure}}[h]\n\\centering\n"
+            f"\\includegraphics[width=0.8\\linewidth]{{images/{fn}}}\n"
+            f"\\end{{figure}}")
+
+
+def recognize_regions(crops, dets, models, images_dir, workers=1, batch_size=16, img_cnt=0, cache=None,
+                      ocr_pool=None, page_ref=None):
+    """Recognize every region and return its .tex lines in ``dets`` order.
+
+    With ``workers > 1`` equations go to a single model worker (one batched
+    Pix2Tex call), text crops are OCR'd on a pool of ``workers`` threads
+    (Tesseract runs as a separate process) and figures are saved on an I/O
+    thread. Figure names are fixed up front, so the output is identical to
+    the sequential path. With a ``crop_cache.CropCache`` only crops it has
+    not seen before reach the models. With an ``ocr_pool`` of processes and
+    the page in shared memory (``shared_pages.SharedPage.ref``), text regions
+    are OCR'd in the pool, which gets only their bboxes. Returns
+    ``(lines, img_cnt)``.
+    """
+    eq_idx = [i for i, det in enumerate(dets) if det["class"] == 0]
+    txt_idx = [i for i, det in enumerate(dets) if det["class"] == 1]
+    fig_names = {}
+    for i, det in enumerate(dets):
+        if det["class"] not in (0, 1):
+            img_cnt += 1
+            fig_names[i] = f"img_{img_cnt:03d}.png"
+
+    latex = lambda images: models.latex(images, batch_size)
+    text = models.text
+    if ocr_pool is not None:
+        from shared_pages import ocr_region
+        bbox_of = {id(crops[i]): dets[i]["bbox"] for i in txt_idx}
+
+        def text(images):
+            futures = [ocr_pool.submit(ocr_region, page_ref, bbox_of[id(im)]) for im in images]
+            return [f.result() for f in futures]
+    if cache is not None:
+        from crop_cache import model_tag
+        eq_tag, txt_tag = model_tag(models, 0), model_tag(models, 1)
+        run_latex, run_text = latex, text
+        latex = lambda images: cache.recognize(run_latex, images, 0, eq_tag)
+        text = lambda images: cache.recognize(run_text, images, 1, txt_tag)
+
+    if workers <= 1:
+        eq_out = latex([crops[i] for i in eq_idx])
+        txt_out = text([crops[i] for i in txt_idx])
+        for i, fn in fig_names.items():
+            crops[i].save(os.path.join(images_dir, fn))
+    else:
+        with ThreadPoolExecutor(1) as model_pool, \
+             ThreadPoolExecutor(workers) as text_pool, \
+             ThreadPoolExecutor(1) as io_pool:
+            eq_future = model_pool.submit(latex, [crops[i] for i in eq_idx])
+            txt_futures = [text_pool.submit(text, [crops[i]]) for i in txt_idx]
+            io_futures = [io_pool.submit(crops[i].save, os.path.join(images_dir, fn))
+                          for i, fn in fig_names.items()]
+            eq_out = eq_future.result()
+            txt_out = [f.result()[0] for f in txt_futures]
+            for f in io_futures:
+                f.result()
+
+    eq_latex = dict(zip(eq_idx, eq_out))
+    txt_ocr = dict(zip(txt_idx, txt_out))
+    lines = []
+    for i, det in enumerate(dets):
+        if det["class"] == 0:  # equation
+            lines.append(equation_line(eq_latex[i]))
+        elif det["class"] == 1:  # text
+            lines.append(txt_ocr[i].strip())
+        else:  # image
+            lines.append(figure_line(fig_names[i]))
+    return lines, img_cnt
+
+
+def page_crops(img, dets, rgb=None):
+    """PIL crops of every detection, converting the page to RGB once (or taking it as ``rgb``)."""
+    import cv2
+    from PIL import Image
+    if rgb is None:
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return [Image.fromarray(rgb[y1:y2, x1:x2]) for x1, y1, x2, y2 in (det["bbox"] for det in dets)]
+
+
+def recognize_page(img, dets, models, images_dir, ocr_pool=None, **kw):
+    """``recognize_regions`` for a BGR page; with an ``ocr_pool`` the page goes through shared memory."""
+    if ocr_pool is None:
+        return recognize_regions(page_crops(img, dets), dets, models, images_dir, **kw)
+    from shared_pages import SharedPage
+    with SharedPage(img) as page:
+        return recognize_regions(page_crops(img, dets, page.array), dets, models, images_dir,
+                                 ocr_pool=ocr_pool, page_ref=page.ref, **kw)
+
+
+def write_tex(tex_path, lines):
+    with open(tex_path, "w", encoding="utf-8") as f:
+        f.write(custom_preamble + '\n')
+        f.write(r"\setdefaultlanguage{russian}" + "\n")
+        f.write(r"\setotherlanguages{english}" + "\n")
+        f.write("\\begin{document}\n\n")
+        for l in lines:
+            f.write(l + "\n\n")
+        f.write("\\end{document}\n")
+
+
+def iter_pages(source, dpi=300):
+    """Yield BGR pages one at a time from a PDF or a directory of page images."""
+    import cv2
+    if os.path.isdir(source):
+        for fn in sorted(os.listdir(source)):
+            if fn.lower().endswith(IMAGE_EXTS):
+                yield cv2.imread(os.path.join(source, fn))
+        return
+    import numpy as np
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    n_pages = pdfinfo_from_path(source)["Pages"]
+    for i in range(1, n_pages + 1):
+        page = convert_from_path(source, dpi=dpi, first_page=i, last_page=i)[0]
+        yield cv2.cvtColor(np.asarray(page.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+def detect_layout(detector, img, conf=0.4):
+    """Run the YOLO layout model on a page and return YOLO-txt style rows."""
+    import layout
+    r = detector.predict(img, conf=conf, verbose=False)[0]
+    return layout.from_result(r).tolist()
+
+
+def prefetch(gen, size=2):
+    """Run ``gen`` on a background thread, keeping at most ``size`` items ready."""
+    q = queue.Queue(maxsize=size)
+    done = object()
+
+    def produce():
+        try:
+            for item in gen:
+                q.put(item)
+        except BaseException as e:
+            q.put(e)
+        q.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def iter_detected_pages(source, runner, dpi=300):
+    """Yield ``(page, dets)`` for every page, detecting layout in batches of ``runner.batch``."""
+    import layout
+    for _, img, rows in runner.stream(iter_pages(source, dpi)):
+        H, W = img.shape[:2]
+        yield img, layout.to_dets(rows, W, H)
+
+
 def main():
     p = argparse.ArgumentParser(description="Merge YOLO+OCR+Pix2Tex into a .tex")
-    p.add_argument("--image",      required=True, help="Full-page image")
-    p.add_argument("--yolo",       required=True, help="YOLO txt detections")
+    p.add_argument("--image",      help="Full-page image")
+    p.add_argument("--yolo",       help="YOLO txt detections")
+    p.add_argument("--document",   help="PDF or directory of page images (runs YOLO in-process)")
+    p.add_argument("--yolo_weights", default=DEFAULT_YOLO_WEIGHTS, help="YOLO weights for --document")
+    p.add_argument("--dpi",        type=int, default=300, help="PDF render DPI for --document")
+    p.add_argument("--conf",       type=float, default=0.4, help="YOLO confidence for --document")
+    p.add_argument("--imgsz",      type=int, default=1024, help="YOLO input size for --document")
+    p.add_argument("--layout_batch", type=int, default=4, help="Pages per YOLO batch for --document")
+    p.add_argument("--backend",    choices=("pt", "onnx", "openvino"), default="pt",
+                   help="Inference backend for YOLO and Pix2Tex (see cpu_models.py)")
+    p.add_argument("--int8",       action="store_true", help="Use the INT8-quantized YOLO export")
+    p.add_argument("--model_dir",  help="Pix2Tex export directory for --backend onnx/openvino")
     p.add_argument("--checkpoint", required=True, help="Pix2Tex .pth checkpoint")
     p.add_argument("--config",     required=True, help="Pix2Tex config.yaml")
     p.add_argument("--output_dir", required=True, help="Where to write output.tex + images/")
     p.add_argument("--temp",       type=float, default=1e-6, help="Pix2Tex temperature")
+    p.add_argument("--batch_size", type=int, default=16, help="Equation crops per Pix2Tex batch")
+    p.add_argument("--workers",    type=int, default=1, help="Parallel OCR workers (1 = sequential)")
+    p.add_argument("--processes",  type=int, default=0,
+                   help="OCR text regions in this many processes, sharing the page memory (0 = in-process)")
+    p.add_argument("--server",     default=model_client.DEFAULT_URL, help="Model server URL (see model_server.py)")
+    p.add_argument("--no_server",  action="store_true", help="Always load the models in-process")
+    p.add_argument("--crop_cache", default=None, help="Recognized-crop cache file (default: $CROP_CACHE or ~/.cache)")
+    p.add_argument("--no_crop_cache", action="store_true", help="Recognize every crop, even repeated ones")
     args = p.parse_args()
-
-    img = cv2.imread(args.image)
-    H, W = img.shape[:2]
+    if not args.document and not (args.image and args.yolo):
+        p.error("either --image and --yolo, or --document is required")
 
     os.makedirs(args.output_dir, exist_ok=True)
     images_dir = os.path.join(args.output_dir, "images")
     os.makedirs(images_dir, exist_ok=True)
 
-    dets = load_yolo(args.yolo, W, H)
-
     model_args = argparse.Namespace(
         checkpoint=args.checkpoint,
         config=args.config,
         temperature=args.temp,
     )
     #pix2tex = LatexOCR(model_args)
-    pix2tex = LatexOCR()
-    lines = []
-    img_cnt = 0
-    for det in dets:
-        x1,y1,x2,y2 = det["bbox"]
-        crop = img[y1:y2, x1:x2]
-        pil = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+    models = None if args.no_server else model_client.connect(args.server)
+    if models is None:
+        models = LocalModels(args.backend, args.model_dir)
+    else:
+        print(f"Using model server at {args.server}")
 
-        if det["class"] == 0:  # equation
-            raw = pix2tex(pil).strip()
-            latex = balance_braces(strip_array_env(raw))
-            lines.append(fr"\\{balance_braces(latex)}\\")
-        elif det["class"] == 1:  # text
-            txt = pytesseract.image_to_string(pil, lang="rus+eng", config="--psm 6").strip()
-            lines.append(txt)
-        else:  # image
-            img_cnt += 1
-            fn = f"img_{img_cnt:03d}.png"
-            pil.save(os.path.join(images_dir, fn))
-            lines.append(f"\\begin{{figure}}[h]\n\\centering\n"
-                         f"\\includegraphics[width=0.8\\linewidth]{{images/{fn}}}\n"
-                         f"\\end{{figure}}")
+    cache = None
+    if not args.no_crop_cache:
+        from crop_cache import CropCache, DEFAULT_PATH
+        cache = CropCache(args.crop_cache or DEFAULT_PATH)
+
+    ocr_pool = None
+    if args.processes > 0:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        ocr_pool = ProcessPoolExecutor(args.processes, mp_context=multiprocessing.get_context("spawn"))
 
     tex_path = os.path.join(args.output_dir, "output.tex")
-    with open(tex_path, "w", encoding="utf-8") as f:
-        f.write(custom_preamble + '\n')
-        f.write(r"\setdefaultlanguage{russian}" + "\n")
-        f.write(r"\setotherlanguages{english}" + "\n")
-        f.write("\\begin{document}\n\n")
-        for l in lines:
-            f.write(l + "\n\n")
-        f.write("\\end{document}\n")
+    if args.document:
+        from layout import LayoutRunner
+        runner = LayoutRunner(args.yolo_weights, imgsz=args.imgsz, batch=args.layout_batch,
+                              conf=args.conf, backend=args.backend, int8=args.int8)
+        # render + detect the next batch on a background thread while this one is OCR'd
+        pages = prefetch(iter_detected_pages(args.document, runner, args.dpi), size=runner.batch)
+        lines = []
+        img_cnt = 0
+        for n, (img, dets) in enumerate(pages):
+            if n:
+                lines.append("\\newpage")
+            page_lines, img_cnt = recognize_page(img, dets, models, images_dir, ocr_pool,
+                                                 workers=args.workers, batch_size=args.batch_size,
+                                                 img_cnt=img_cnt, cache=cache)
+            lines.extend(page_lines)
+            print(f"Page {n + 1}: {len(dets)} regions")
+        print(f"Layout: {runner.images} pages at {runner.rate():.1f} pages/s")
+    else:
+        import cv2
+        img = cv2.imread(args.image)
+        H, W = img.shape[:2]
+        dets = load_yolo(args.yolo, W, H)
+        lines, _ = recognize_page(img, dets, models, images_dir, ocr_pool,
+                                  workers=args.workers, batch_size=args.batch_size, cache=cache)
+
+    if ocr_pool is not None:
+        ocr_pool.shutdown()
+    write_tex(tex_path, lines)
+    if cache is not None:
+        print(f"Crop cache: {cache.stats()}")
+        cache.close()
 
     print(f"Wrote to: {tex_path}")
 
@@ -0,0 +1,88 @@
+"""Thin client for model_server.py.
+
+Only the standard library and PIL are imported here so that the CLIs can talk
+to a running server without paying for torch / pix2tex / ultralytics imports;
+urllib is imported on first use, so parsing arguments doesn't pay for it either.
+"""
+import io
+import os
+import json
+import base64
+
+DEFAULT_URL = os.getenv("MODEL_SERVER_URL", "http://127.0.0.1:8765")
+
+
+def encode_image(pil):
+    buf = io.BytesIO()
+    pil.save(buf, "PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def decode_image(data):
+    from PIL import Image
+    return Image.open(io.BytesIO(base64.b64decode(data))).convert("RGB")
+
+
+class RemoteModels:
+    """Same interface as merging.LocalModels, backed by a running model_server.py."""
+
+    def __init__(self, url=DEFAULT_URL, timeout=600, health=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.health = health
+
+    def _request(self, path, payload=None):
+        """POST ``payload`` as JSON to ``path``, or GET it without a payload."""
+        import urllib.error
+        import urllib.request
+        req = urllib.request.Request(
+            self.url + path,
+            data=None if payload is None else json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                data = json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            data = json.loads(e.read().decode("utf-8") or "{}")
+            data.setdefault("error", f"HTTP {e.code}")
+        if "error" in data:
+            raise RuntimeError(f"Model server error: {data['error']}")
+        return data
+
+    def describe(self):
+        """Backend, weights and versions of the server's models, from its /health."""
+        if self.health is None:
+            self.health = self._request("/health")
+        return {"backend": self.health.get("backend", "unknown"),
+                "weights": self.health.get("weights", "unknown"),
+                "versions": self.health.get("versions", {})}
+
+    def latex(self, images, batch_size=16):
+        if not images:
+            return []
+        data = self._request("/latex", {"images": [encode_image(im) for im in images], "batch_size": batch_size})
+        return data["latex"]
+
+    def text(self, images):
+        if not images:
+            return []
+        return self._request("/text", {"images": [encode_image(im) for im in images]})["text"]
+
+    def layout(self, image, conf=0.4):
+        """YOLO rows ``[cls, xc, yc, w, h, conf]`` (normalized) for a full page."""
+        return self._request("/layout", {"image": encode_image(image), "conf": conf})["rows"]
+
+
+def connect(url=DEFAULT_URL, timeout=0.5):
+    """Return a RemoteModels client if a server answers at ``url``, else None."""
+    import urllib.error
+    import urllib.request
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/health", timeout=timeout) as resp:
+            if resp.status != 200:
+                return None
+            health = json.loads(resp.read().decode("utf-8"))
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    return RemoteModels(url, health=health)
@@ -0,0 +1,112 @@
+"""Long-lived inference server for merging.py / eq_to_latex.py.
+
+Loads Pix2Tex, the YOLO layout model and Tesseract once and serves requests on
+localhost, so the CLIs don't pay the import + checkpoint load on every run:
+
+    python model_server.py --port 8765
+
+Endpoints (JSON, images are base64 PNG):
+    GET  /health                              -> {"ok": true, "models": [...], "backend": ...,
+                                                  "weights": ..., "versions": {...}}
+    POST /latex  {"images": [...], "batch_size": n} -> {"latex": [...]}
+    POST /text   {"images": [...]}            -> {"text": [...]}
+    POST /layout {"image": ..., "conf": 0.4}  -> {"rows": [[cls, xc, yc, w, h, conf], ...]}
+"""
+import os
+import json
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from model_client import decode_image
+from merging import LocalModels, DEFAULT_YOLO_WEIGHTS, detect_layout
+
+
+class Models(LocalModels):
+    """LocalModels plus the YOLO layout model, guarded for a threaded server."""
+
+    def __init__(self, yolo_weights=None, backend="pt", model_dir=None):
+        super().__init__(backend, model_dir)
+        self.lock = threading.Lock()
+        self.yolo = None
+        if yolo_weights and os.path.isfile(yolo_weights):
+            from ultralytics import YOLO
+            self.yolo = YOLO(yolo_weights)
+
+    def latex(self, images, batch_size=16):
+        with self.lock:
+            return super().latex(images, batch_size)
+
+    def layout(self, image, conf=0.4):
+        if self.yolo is None:
+            raise RuntimeError("YOLO weights were not loaded")
+        with self.lock:
+            return detect_layout(self.yolo, image, conf)
+
+    def names(self):
+        return [f"pix2tex ({self.backend})", "tesseract"] + (["yolo"] if self.yolo is not None else [])
+
+
+def make_handler(models):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"ok": True, "models": models.names(), **models.describe()})
+            else:
+                self._reply(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                req = json.loads(self.rfile.read(length).decode("utf-8"))
+                if self.path == "/latex":
+                    images = [decode_image(b) for b in req["images"]]
+                    out = {"latex": models.latex(images, req.get("batch_size", 16))}
+                elif self.path == "/text":
+                    out = {"text": models.text([decode_image(b) for b in req["images"]])}
+                elif self.path == "/layout":
+                    out = {"rows": models.layout(decode_image(req["image"]), req.get("conf", 0.4))}
+                else:
+                    self._reply(404, {"error": f"unknown path {self.path}"})
+                    return
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+                return
+            self._reply(200, out)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    p = argparse.ArgumentParser(description="Serve Pix2Tex / Tesseract / YOLO over localhost HTTP")
+    p.add_argument("--host",         default="127.0.0.1")
+    p.add_argument("--port",         type=int, default=8765)
+    p.add_argument("--yolo_weights", default=DEFAULT_YOLO_WEIGHTS, help="YOLO layout weights (.pt)")
+    p.add_argument("--backend",      choices=("pt", "onnx", "openvino"), default="pt", help="Pix2Tex backend")
+    p.add_argument("--model_dir",    help="Pix2Tex export directory for --backend onnx/openvino")
+    args = p.parse_args()
+
+    models = Models(args.yolo_weights, args.backend, args.model_dir)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(models))
+    print(f"Model server listening on http://{args.host}:{args.port} ({', '.join(models.names())})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,28 @@
 import os
 import uuid
 import shutil
-import re
 import asyncio
-import subprocess
 from telegram import Update
 from telegram.ext import ApplicationBuilder, MessageHandler, CommandHandler, ContextTypes, filters
-import os
+
+from jobs import JobQueue
+from checkpoint import work_dir_path
+from progress import ProgressMessage
+from latex_compile import CompileService
+import progress
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+WORKERS = int(os.getenv("BOT_WORKERS", "2"))
+JOBS_PER_USER = int(os.getenv("BOT_JOBS_PER_USER", "1"))
+PROGRESS_INTERVAL = float(os.getenv("BOT_PROGRESS_INTERVAL", "3"))
+PIPELINE_CMD = ["python", "-u", "main.py"]
 bar_width = 20
 
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Hi! Send me a file and I’ll return a processed ZIP file and compiled PDF.")
 
+
 async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     document = update.message.document
     if not document:
@@ -22,23 +31,45 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     input_ext = os.path.splitext(document.file_name)[1]
     input_path = f"input_{uuid.uuid4().hex}{input_ext}"
-    output_folder = f"output_{uuid.uuid4().hex}"
 
     telegram_file = await context.bot.get_file(document.file_id)
     await telegram_file.download_to_drive(input_path)
 
-    status_msg = await update.message.reply_text("Starting processing…")
-    chat_id = status_msg.chat_id
-    msg_id = status_msg.message_id
+    queue = context.bot_data["queue"]
+    status_msg = await update.message.reply_text(f"Queued, position {len(queue.queued()) + 1}…")
+    queue.enqueue(update.effective_user.id, status_msg.chat_id, input_path,
+                  file_name=document.file_name, message_id=status_msg.message_id)
+    context.bot_data["wake"].set()
+
+
+def progress_bar(current, total):
+    done_chars = int((current / total) * bar_width) if total else 0
+    return "<code>[" + "#" * done_chars + "-" * (bar_width - done_chars) + "]</code>"
+
+
+async def run_job(bot, job, pipeline_cmd=PIPELINE_CMD, compiler=None):
+    chat_id = job["chat_id"]
+    msg_id = job["message_id"]
+    input_path = job["input_path"]
+    output_folder = f"output_{uuid.uuid4().hex}"
+    work_path = None
+
+    status = ProgressMessage(bot, chat_id, msg_id, PROGRESS_INTERVAL)
+    await status.finish("Starting processing…")
 
-    in_step5 = False
     total_fragments = None
+    tex_path = None
+    last_line = ""
+    compile_note = ""
 
     try:
+        # the pipeline keeps its work dir when it fails; a failed job is final, so it goes too
+        work_path = work_dir_path(input_path, job_id=job["id"])
         proc = await asyncio.create_subprocess_exec(
-            "python", "-u", "main.py", input_path, output_folder,
+            *pipeline_cmd, input_path, output_folder, "--job_id", str(job["id"]),
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT
+            stderr=asyncio.subprocess.STDOUT,
+            env={**os.environ, "PIPELINE_PROGRESS": "json"}
         )
 
         while True:
@@ -46,78 +77,42 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if not raw:
                 break
             line = raw.decode().rstrip()
-
-            m_step = re.match(r"^\[Step\s+(\d+)\]", line)
-            if m_step:
-                step_num = int(m_step.group(1))
-                if step_num == 5:
-                    in_step5 = True
-                    # Show Step 5 header + empty code‐bar
-                    await context.bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=msg_id,
-                        text=(
-                            "[Step 5] Proofreading LaTeX file with LLM...\n"
-                            "Progress: <code>[" + "-" * bar_width + "]</code> 0/?? (0%)"
-                        ),
-                        parse_mode="HTML"
-                    )
-                    continue
+            event = progress.parse(line)
+            if event is None:
+                # the last log line of a failed run is usually the exception
+                last_line = line or last_line
+                continue
+
+            if event["event"] == "step":
+                total_fragments = None
+                if event["step"] == 5:
+                    await status.update("[Step 5] Proofreading LaTeX file with LLM...\n"
+                                        f"Progress: {progress_bar(0, 0)} 0/?? (0%)", parse_mode="HTML")
                 else:
-                    in_step5 = False
-                    await context.bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=msg_id,
-                        text=line
-                    )
-                    continue
-
-            if in_step5:
-                m_total = re.search(r"Total fragments:\s*(\d+)", line)
-                if m_total:
-                    total_fragments = int(m_total.group(1))
-                    if total_fragments:
-                        empty_code_bar = "<code>[" + "-" * bar_width + "]</code>"
-                        await context.bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=msg_id,
-                            text=(
-                                "Proofreading LaTeX file with LLM...\n"
-                                f"Progress: {empty_code_bar} 0/{total_fragments} (0%)"
-                            ),
-                            parse_mode="HTML"
-                        )
-                    continue
-
-                m_frag = re.search(r"Correcting fragment\s+(\d+)/(\d+)", line)
-                if m_frag and total_fragments:
-                    current = int(m_frag.group(1))
-                    total = int(m_frag.group(2))
-                    done_chars = int((current / total) * bar_width)
-                    bar_inside = "#" * done_chars + "-" * (bar_width - done_chars)
-                    pct = int((current / total) * 100)
-                    code_bar = "<code>[" + bar_inside + "]</code>"
-                    await context.bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=msg_id,
-                        text=(
-                            "Proofreading LaTeX file with LLM...\n"
-                            f"Progress: {code_bar} {current}/{total} ({pct}%)"
-                        ),
-                        parse_mode="HTML"
-                    )
-                    continue
-
+                    await status.update(f"[Step {event['step']}] {event['title']}")
+            elif event["event"] == "total":
+                total_fragments = event["total"]
+                if total_fragments:
+                    await status.update("Proofreading LaTeX file with LLM...\n"
+                                        f"Progress: {progress_bar(0, total_fragments)} 0/{total_fragments} (0%)",
+                                        parse_mode="HTML")
+            elif event["event"] == "fragment" and total_fragments:
+                current, total = event["done"], event["total"]
+                pct = int((current / total) * 100)
+                await status.update("Proofreading LaTeX file with LLM...\n"
+                                    f"Progress: {progress_bar(current, total)} {current}/{total} ({pct}%)",
+                                    parse_mode="HTML")
 
         await proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError(f"Pipeline failed (exit code {proc.returncode}): {last_line}")
 
         zip_name = f"{output_folder}.zip"
         shutil.make_archive(base_name=output_folder, format="zip", root_dir=output_folder)
 
         with open(zip_name, "rb") as f_zip:
-            await update.message.reply_document(document=f_zip)
+            await bot.send_document(chat_id=chat_id, document=f_zip)
 
-        tex_path = None
         for root, dirs, files in os.walk(output_folder):
             for fname in files:
                 if fname.endswith(".tex"):
@@ -129,52 +124,37 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if tex_path:
             tex_dir = os.path.dirname(tex_path)
             tex_file = os.path.basename(tex_path)
-            pdf_name = tex_file.rsplit(".", 1)[0] + ".pdf"
-            pdf_path = os.path.join(tex_dir, pdf_name)
-
             xelatexelog = os.path.join(tex_dir, tex_file.rsplit(".", 1)[0] + "_xelatex.log")
-            try:
-                with open(xelatexelog, "w", encoding="utf-8", errors="ignore") as logf:
-                    subprocess.run(
-                        [
-                            "xelatex",
-                            "-interaction=nonstopmode",
-                            "-halt-on-error",
-                            tex_file
-                        ],
-                        cwd=tex_dir,
-                        stdout=logf,
-                        stderr=subprocess.STDOUT,
-                        check=True
-                    )
-                pdf_name = tex_file.rsplit(".", 1)[0] + ".pdf"
-                pdf_path = os.path.join(tex_dir, pdf_name)
-                if os.path.isfile(pdf_path):
-                    with open(pdf_path, "rb") as f_pdf:
-                        await update.message.reply_document(document=f_pdf)
-                else:
-                    await update.message.reply_text("❗ PDF was not created. Here is the xelatex log:")
-                    with open(xelatexelog, "rb") as f_log:
-                        await update.message.reply_document(document=f_log, filename=os.path.basename(xelatexelog))
 
-            except subprocess.CalledProcessError:
-                await update.message.reply_text("❗ PDF compilation failed. See log:")
+            if compiler is None:
+                compiler = CompileService(workers=1)
+            result = await compiler.compile(tex_dir, tex_file, xelatexelog)
+            pdf_path = result.pdf_path
+            if result.timed_out:
+                await bot.send_message(chat_id=chat_id,
+                                       text=f"❗ PDF compilation timed out after {compiler.timeout:.0f}s. See log:")
                 with open(xelatexelog, "rb") as f_log:
-                    await update.message.reply_document(document=f_log, filename=os.path.basename(xelatexelog))
+                    await bot.send_document(chat_id=chat_id, document=f_log, filename=os.path.basename(xelatexelog))
+            elif result.returncode != 0:
+                await bot.send_message(chat_id=chat_id, text="❗ PDF compilation failed. See log:")
+                with open(xelatexelog, "rb") as f_log:
+                    await bot.send_document(chat_id=chat_id, document=f_log, filename=os.path.basename(xelatexelog))
+            elif os.path.isfile(pdf_path):
+                with open(pdf_path, "rb") as f_pdf:
+                    await bot.send_document(chat_id=chat_id, document=f_pdf)
+                compile_note = f" PDF compiled in {result.seconds:.1f}s."
+            else:
+                await bot.send_message(chat_id=chat_id, text="❗ PDF was not created. Here is the xelatex log:")
+                with open(xelatexelog, "rb") as f_log:
+                    await bot.send_document(chat_id=chat_id, document=f_log, filename=os.path.basename(xelatexelog))
 
-        await context.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=msg_id,
-            text="✓ Processing complete. ZIP and PDF (if compiled) have been sent."
-        )
+        await status.finish("✓ Processing complete. ZIP and PDF (if compiled) have been sent." + compile_note)
 
     except Exception as e:
-        await context.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=msg_id,
-            text=f"⛔ Error during processing:\n{e}"
-        )
-        return
+        if work_path is not None:
+            shutil.rmtree(work_path, ignore_errors=True)
+        await status.finish(f"⛔ Error during processing:\n{e}")
+        raise
 
     finally:
         shutil.rmtree(output_folder, ignore_errors=True)
@@ -197,8 +177,61 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except:
                 pass
 
+
+async def report_positions(bot, queue, shown):
+    """Tell every waiting user their current place in the queue (only when it changed)."""
+    for pos, job in enumerate(queue.queued(), start=1):
+        if job["message_id"] is None or shown.get(job["id"]) == pos:
+            continue
+        shown[job["id"]] = pos
+        try:
+            await bot.edit_message_text(chat_id=job["chat_id"], message_id=job["message_id"],
+                                        text=f"Queued, position {pos}…")
+        except Exception:
+            pass
+
+
+async def worker(bot, queue, wake, shown, pipeline_cmd=PIPELINE_CMD, per_user_limit=JOBS_PER_USER, compiler=None):
+    """Take jobs off ``queue`` forever; ``wake`` is set whenever a job is added or finished."""
+    while True:
+        job = queue.claim(per_user_limit)
+        if job is None:
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        shown.pop(job["id"], None)
+        await report_positions(bot, queue, shown)
+        try:
+            await run_job(bot, job, pipeline_cmd, compiler)
+        except Exception as e:
+            queue.finish(job["id"], error=str(e) or type(e).__name__)
+        else:
+            queue.finish(job["id"])
+        wake.set()
+
+
+async def start_workers(app):
+    queue = JobQueue()
+    wake = asyncio.Event()
+    shown = {}
+    compiler = CompileService()
+    app.bot_data["queue"] = queue
+    app.bot_data["wake"] = wake
+    app.bot_data["compiler"] = compiler
+    app.bot_data["workers"] = [
+        asyncio.get_running_loop().create_task(
+            worker(app.bot, queue, wake, shown, PIPELINE_CMD, JOBS_PER_USER, compiler))
+        for _ in range(WORKERS)
+    ]
+    wake.set()
+
+
 def main():
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = ApplicationBuilder().token(BOT_TOKEN).post_init(start_workers).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.Document.ALL, handle_file))
     app.run_polling()
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from mathpix_cache import file_hash
+
+DEFAULT_ROOT = os.getenv("PIPELINE_WORK_DIR", "work")
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def work_dir_path(input_path, root=DEFAULT_ROOT, job_id=None):
+    """Where ``WorkDir.for_input`` keeps the artifacts of ``input_path``, without creating it."""
+    name = file_hash(input_path)[:16]
+    if job_id is not None:
+        name += f"-{job_id}"
+    return os.path.join(root, name)
+
+
+class WorkDir:
+    """Per-job directory of stage artifacts plus a ``manifest.json`` of finished stages.
+
+    For every finished stage the manifest keeps the inputs it ran with (file
+    hashes and parameters) and the SHA-256 of each artifact it produced. A
+    stage is skipped on a rerun only if its inputs are the same and all of its
+    artifacts are still on disk unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, "manifest.json")
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {"stages": {}}
+
+    @classmethod
+    def for_input(cls, input_path, root=DEFAULT_ROOT, job_id=None):
+        """The work dir of ``input_path``, named after its content hash so reruns find it.
+
+        With ``job_id`` the dir belongs to that job alone, so concurrent jobs
+        on the same file don't overwrite or remove each other's artifacts.
+        """
+        return cls(work_dir_path(input_path, root, job_id))
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def done(self, stage, inputs):
+        entry = self.manifest["stages"].get(stage)
+        if entry is None or entry["inputs"] != inputs:
+            return False
+        for name, digest in entry["outputs"].items():
+            path = self.file(name)
+            if not os.path.isfile(path) or file_hash(path) != digest:
+                return False
+        return True
+
+    def complete(self, stage, inputs, outputs):
+        """Record ``stage`` as finished; ``outputs`` are artifact paths inside the work dir."""
+        self.manifest["stages"][stage] = {
+            "inputs": inputs,
+            "outputs": {os.path.relpath(p, self.path): file_hash(p) for p in outputs},
+            "finished_at": time.time(),
+        }
+        _write_json(self.manifest_path, self.manifest)
+
+    def output_hash(self, stage, name):
+        return self.manifest["stages"][stage]["outputs"][name]
+
+
+class Journal:
+    """Append-only JSONL log of proofread fragments, so an interrupted run can pick up where it stopped.
+
+    Each line is ``{"index", "source", "text"}`` where ``source`` is the hash
+    of the fragment as sent. Entries are only reused for the same fragment
+    text; a torn last line from a crash is cut off when the journal is opened,
+    so the next entry starts on a line of its own.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    f.truncate(end)
+            for line in data[:end].decode("utf-8").splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.entries[(entry["index"], entry["source"])] = entry["text"]
+        self.f = open(path, "a", encoding="utf-8")
+
+    def get(self, index, fragment):
+        return self.entries.get((index, text_hash(fragment)))
+
+    def append(self, index, fragment, text):
+        line = json.dumps({"index": index, "source": text_hash(fragment), "text": text}, ensure_ascii=False)
+        with self.lock:
+            self.entries[(index, text_hash(fragment))] = text
+            self.f.write(line + "\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        self.f.close()
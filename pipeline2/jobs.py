@@ -0,0 +1,73 @@
+import os
+import time
+import sqlite3
+import threading
+
+DEFAULT_PATH = os.getenv("JOBS_DB", "jobs.sqlite")
+
+
+class JobQueue:
+    """Persistent FIFO of bot jobs in SQLite.
+
+    Jobs go ``queued -> running -> done/failed``. Jobs left ``running`` by a
+    crashed bot are put back in the queue when it starts again.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, message_id INTEGER,"
+            " input_path TEXT NOT NULL, file_name TEXT,"
+            " status TEXT NOT NULL DEFAULT 'queued', error TEXT,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id)")
+        self.db.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+
+    def enqueue(self, user_id, chat_id, input_path, file_name=None, message_id=None):
+        with self.lock:
+            cur = self.db.execute(
+                "INSERT INTO jobs (user_id, chat_id, message_id, input_path, file_name, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, message_id, input_path, file_name, time.time()),
+            )
+            return cur.lastrowid
+
+    def claim(self, per_user_limit=1):
+        """Mark the oldest queued job whose user is under ``per_user_limit`` as running and return it."""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT * FROM jobs AS j WHERE status = 'queued' AND"
+                    " (SELECT COUNT(*) FROM jobs WHERE user_id = j.user_id AND status = 'running') < ?"
+                    " ORDER BY id LIMIT 1",
+                    (per_user_limit,),
+                ).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                                    (time.time(), row["id"]))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            return dict(row) if row is not None else None
+
+    def finish(self, job_id, error=None):
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id),
+            )
+
+    def queued(self):
+        with self.lock:
+            return [dict(r) for r in self.db.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id")]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,244 @@
+"""xelatex compilation for the bot, with a precompiled preamble format.
+
+Every document produced by the pipeline starts with the same custom preamble
+(see ``preambula_adder.py``). The package-loading half of it, everything up to
+``\\csname endofdump\\endcsname``, is dumped once into a format file
+(mylatexformat-style) and each compile starts from that format instead of
+reloading the packages. The rest of the preamble (polyglossia / fontspec and
+font selection) has to stay in the document, since XeTeX cannot dump native
+fonts; its ``\\IfFontExistsTF`` checks are resolved ahead of time from a cached
+``fc-list`` so xelatex does not search for fonts on every run.
+
+    service = CompileService(workers=2, timeout=120)
+    result = await service.compile(tex_dir, "doc.tex", "doc_xelatex.log")
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import subprocess
+from functools import lru_cache
+
+ENGINE = "xelatex"
+DEFAULT_DIR = os.getenv(
+    "LATEX_FORMAT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "coursework2025", "latex"),
+)
+WORKERS = int(os.getenv("LATEX_WORKERS", "2"))
+TIMEOUT = float(os.getenv("LATEX_TIMEOUT", "180"))
+DUMP_MARKER = r"\csname endofdump\endcsname"
+# packages that load native fonts and so can't go into the format
+_FONT_PACKAGE_RE = re.compile(r"\\usepackage(\[[^\]]*\])?\{(polyglossia|fontspec|unicode-math)\}")
+_FONT_CHECK = r"\IfFontExistsTF"
+
+
+@lru_cache(maxsize=1)
+def engine_version():
+    try:
+        out = subprocess.run([ENGINE, "--version"], capture_output=True, text=True, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.splitlines()[0] if out else None
+
+
+@lru_cache(maxsize=1)
+def font_names():
+    """Lower-cased family and full names of the installed fonts, or None without fontconfig."""
+    try:
+        out = subprocess.run(["fc-list", ":", "family", "fullname"],
+                             capture_output=True, text=True, timeout=60).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    names = set()
+    for line in out.splitlines():
+        for field in line.split(":"):
+            field = field.split("=", 1)[-1]
+            names.update(n.strip().lower() for n in field.split(",") if n.strip())
+    return names
+
+
+def _group(text, pos):
+    """Return (content, end) of the brace group starting at or after ``pos``."""
+    start = text.index("{", pos)
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i], i + 1
+    raise ValueError("unbalanced braces")
+
+
+def resolve_font_checks(tex, names):
+    """Replace every ``\\IfFontExistsTF{font}{yes}{no}`` with the branch ``names`` selects."""
+    out = []
+    pos = 0
+    while True:
+        i = tex.find(_FONT_CHECK, pos)
+        if i < 0:
+            out.append(tex[pos:])
+            return "".join(out)
+        font, end = _group(tex, i + len(_FONT_CHECK))
+        yes, end = _group(tex, end)
+        no, end = _group(tex, end)
+        branch = yes if font.strip().lower() in names else no
+        out.append(tex[pos:i])
+        out.append(resolve_font_checks(branch, names))
+        pos = end
+
+
+def split_preamble(tex):
+    """Split a document into (static preamble, font preamble, body), or None if it has no usable preamble."""
+    head, sep, body = tex.partition(r"\begin{document}")
+    if not sep or r"\documentclass" not in head:
+        return None
+    if DUMP_MARKER in head:
+        static, _, fonts = head.partition(DUMP_MARKER)
+    else:
+        m = _FONT_PACKAGE_RE.search(head)
+        static, fonts = (head[:m.start()], head[m.start():]) if m else (head, "")
+    return static, fonts, sep + body
+
+
+class CompileResult:
+    def __init__(self, returncode, pdf_path, log_path, seconds, used_format, timed_out=False):
+        self.returncode = returncode
+        self.pdf_path = pdf_path
+        self.log_path = log_path
+        self.seconds = seconds
+        self.used_format = used_format
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and os.path.isfile(self.pdf_path)
+
+
+class CompileService:
+    """Runs at most ``workers`` xelatex processes at a time, each limited to ``timeout`` seconds.
+
+    Formats are built once per distinct static preamble (and xelatex version)
+    and kept in ``format_dir``; if building one fails, documents are compiled
+    cold as before. A compile that fails with the format is retried cold; if
+    that succeeds the format was at fault and is rebuilt on next use, and
+    dropped for good if the rebuilt one fails too.
+    """
+
+    def __init__(self, workers=WORKERS, timeout=TIMEOUT, format_dir=DEFAULT_DIR):
+        self.timeout = timeout
+        self.format_dir = format_dir
+        self.slots = asyncio.Semaphore(workers)
+        self.format_locks = {}
+        self.failed_formats = set()
+        self.rebuilt_formats = set()
+        os.makedirs(format_dir, exist_ok=True)
+
+    async def _run(self, args, cwd, log_path, env=None):
+        """Run one engine process; returns (returncode, timed_out)."""
+        with open(log_path, "w", encoding="utf-8", errors="ignore") as logf:
+            proc = await asyncio.create_subprocess_exec(
+                *args, cwd=cwd, stdout=logf, stderr=asyncio.subprocess.STDOUT,
+                stdin=asyncio.subprocess.DEVNULL, env=env,
+            )
+            try:
+                return await asyncio.wait_for(proc.wait(), self.timeout), False
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                return proc.returncode, True
+
+    def _env(self):
+        # TEXFORMATS: search the format dir first, then the engine's defaults
+        return {**os.environ, "TEXFORMATS": self.format_dir + os.pathsep}
+
+    async def format_for(self, static):
+        """Name of the format dumped from ``static``, building it on first use; None if that fails."""
+        version = engine_version()
+        if version is None:
+            return None
+        name = "pre_" + hashlib.sha256((version + "\n" + static).encode("utf-8")).hexdigest()[:16]
+        if name in self.failed_formats:
+            return None
+        fmt_path = os.path.join(self.format_dir, name + ".fmt")
+        lock = self.format_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if os.path.isfile(fmt_path):
+                return name
+            src = os.path.join(self.format_dir, name + ".tex")
+            with open(src, "w", encoding="utf-8") as f:
+                f.write(static + "\n\\dump\n")
+            start = time.perf_counter()
+            code, timed_out = await self._run(
+                [ENGINE, "-ini", "-interaction=nonstopmode", f"-jobname={name}", f"&{ENGINE}", name + ".tex"],
+                self.format_dir, os.path.join(self.format_dir, name + ".log"))
+            if code != 0 or timed_out or not os.path.isfile(fmt_path):
+                logging.warning(f"Building format {name} failed, compiling without it "
+                                f"(see {os.path.join(self.format_dir, name + '.log')})")
+                self.failed_formats.add(name)
+                return None
+            logging.info(f"Built format {name} in {time.perf_counter() - start:.1f}s")
+            return name
+
+    async def discard_format(self, name):
+        """Delete format ``name`` after it broke a compile, so it is rebuilt; a second time, stop using it."""
+        async with self.format_locks.setdefault(name, asyncio.Lock()):
+            if name in self.rebuilt_formats:
+                self.failed_formats.add(name)
+            self.rebuilt_formats.add(name)
+            try:
+                os.remove(os.path.join(self.format_dir, name + ".fmt"))
+            except OSError:
+                pass
+
+    async def _compile_once(self, tex_dir, tex_file, log_path, parts, fmt):
+        """One engine run, starting from format ``fmt`` if given; returns (returncode, timed_out)."""
+        stem = os.path.splitext(tex_file)[0]
+        fast_file = None
+        if fmt is not None:
+            static, fonts, body = parts
+            names = font_names()
+            if names is not None:
+                fonts = resolve_font_checks(fonts, names)
+            fast_file = stem + ".fmt-body.tex"
+            with open(os.path.join(tex_dir, fast_file), "w", encoding="utf-8") as f:
+                f.write(fonts + body)
+            args = [ENGINE, f"-fmt={fmt}", "-interaction=nonstopmode", "-halt-on-error",
+                    f"-jobname={stem}", fast_file]
+        else:
+            args = [ENGINE, "-interaction=nonstopmode", "-halt-on-error", tex_file]
+        try:
+            return await self._run(args, tex_dir, log_path, self._env())
+        finally:
+            if fast_file:
+                try:
+                    os.remove(os.path.join(tex_dir, fast_file))
+                except OSError:
+                    pass
+
+    async def compile(self, tex_dir, tex_file, log_path):
+        """Compile ``tex_dir/tex_file`` to ``<stem>.pdf`` next to it; the xelatex log goes to ``log_path``."""
+        stem = os.path.splitext(tex_file)[0]
+        pdf_path = os.path.join(tex_dir, stem + ".pdf")
+        with open(os.path.join(tex_dir, tex_file), encoding="utf-8") as f:
+            parts = split_preamble(f.read())
+
+        async with self.slots:
+            start = time.perf_counter()
+            fmt = await self.format_for(parts[0]) if parts else None
+            code, timed_out = await self._compile_once(tex_dir, tex_file, log_path, parts, fmt)
+            if fmt is not None and code != 0 and not timed_out:
+                logging.warning(f"Compiling {tex_file} with format {fmt} failed, retrying without it")
+                broken, fmt = fmt, None
+                code, timed_out = await self._compile_once(tex_dir, tex_file, log_path, parts, None)
+                if code == 0:
+                    await self.discard_format(broken)
+            seconds = time.perf_counter() - start
+
+        result = CompileResult(code, pdf_path, log_path, seconds, fmt is not None, timed_out)
+        logging.info(f"Compiled {tex_file} in {seconds:.1f}s "
+                     f"({'format ' + fmt if fmt else 'cold'}, exit {code}{', timed out' if timed_out else ''})")
+        return result
@@ -1,12 +1,62 @@
 import os
 import time
+import hashlib
+import random
 import logging
 import re
-from openai import OpenAI
+import threading
+from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from ratelimit import RateLimiter
+from proofread_cache import ProofreadCache, cache_key
+import progress
+import tracing
+from checkpoint import Journal
 
 MODEL = "gpt-4o"
 RETRY_LIMIT = 3
-RATE_LIMIT_SECONDS = 1.5
+RATE_LIMIT_RETRIES = 8
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30000
+TEMPERATURE = 0
+# a short or runaway completion is retried once at this temperature, since at
+# TEMPERATURE the same request gives nearly the same answer
+RETRY_TEMPERATURE = 0.4
+MAX_TOKENS = 2048
+# a truncated completion is retried with max_tokens doubled, up to this
+MAX_OUTPUT_TOKENS = 8192
+MIN_PROSE_WORDS = 3
+# input tokens per request; corrected output is about as long and must fit max_tokens
+TARGET_TOKENS = 900
+# packs end where a fragment's hash says so (about once per BOUNDARY_TOKENS of
+# prose) but not before MIN_PACK_TOKENS, so an edit only moves its own pack
+MIN_PACK_TOKENS = 300
+BOUNDARY_TOKENS = 400
+# a correction keeps roughly the input's word count; outside these bounds it is retried once
+MIN_WORD_RATIO = 0.7
+MAX_WORD_RATIO = 1.5
+RUNAWAY_SLACK_WORDS = 20
+
+USER_PROMPT = (
+    "Fix only grammatical errors in the following LaTeX fragment. "
+    "Do not rephrase or change content. Preserve all LaTeX formatting. "
+    "Return only the corrected LaTeX text:\n"
+)
+
+SYSTEM_PROMPT = (
+    "You are a LaTeX proofreader. Your task is to review LaTeX content containing possible "
+    "grammatical or spelling mistakes in the natural language text portions only. "
+    "If you find grammatical or spelling errors in the text portions, correct them. "
+    "Use context to correct grammatical or spelling mistakes. "
+    "Do not modify any LaTeX commands, environments, math expressions, labels, citations, or formatting. "
+    "Output only the corrected LaTeX code without any commentary or explanation. "
+    r"Never add \end{document} to the output, even if it seems missing. Do not delete existing \end{document}."
+    "Do not add any markdown code fences like ```latex or ``` around the output. "
+    "Never replace Latin letters inside math expressions with Cyrillic letters."
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,42 +68,171 @@ logging.basicConfig(
 )
 
 
-def get_response(fragment, client, model=MODEL, max_tokens=2048):
-    prompt = (
-        "Fix only grammatical errors in the following LaTeX fragment. "
-        "Do not rephrase or change content. Preserve all LaTeX formatting. "
-        "Return only the corrected LaTeX text:\n" + fragment
-    )
-
-    system_prompt = (
-        "You are a LaTeX proofreader. Your task is to review LaTeX content containing possible "
-        "grammatical or spelling mistakes in the natural language text portions only. "
-        "If you find grammatical or spelling errors in the text portions, correct them. "
-        "Use context to correct grammatical or spelling mistakes. "
-        "Do not modify any LaTeX commands, environments, math expressions, labels, citations, or formatting. "
-        "Output only the corrected LaTeX code without any commentary or explanation. "
-        r"Never add \end{document} to the output, even if it seems missing. Do not delete existing \end{document}."
-        "Do not add any markdown code fences like ```latex or ``` around the output. "
-        "Never replace Latin letters inside math expressions with Cyrillic letters."
-    )
-
-    for attempt in range(RETRY_LIMIT):
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def estimate_tokens(text):
+    """Token count from the local tiktoken encoding, or ~4 characters per token without it."""
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def retry_after(error, attempt):
+    """Seconds to wait after a 429: the server's Retry-After if given, else jittered backoff."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(60.0, 2 ** attempt) * (0.5 + random.random())
+
+
+def check_output(fragment, text, final=True):
+    """Why ``text`` is not a usable correction of ``fragment`` (``runaway`` / ``short``), or None.
+
+    With ``final=False`` ``text`` is a completion still being streamed, and
+    only a runaway (far more words than the input) can be told already.
+    """
+    words, limit = len(text.split()), len(fragment.split())
+    if words > MAX_WORD_RATIO * limit + RUNAWAY_SLACK_WORDS:
+        return "runaway"
+    if final and words < MIN_WORD_RATIO * limit:
+        return "short"
+    return None
+
+
+def read_stream(stream, fragment, start):
+    """Collect a streamed completion, closing it as soon as ``check_output`` objects.
+
+    Returns ``(text, finish_reason, usage, problem, first_token_s)``; ``problem``
+    is None for a usable completion, ``truncated`` if it hit max_tokens.
+    """
+    text, finish_reason, usage, problem, first_token = "", None, None, None, None
+    with stream:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta is not None and choice.delta.content:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                text += choice.delta.content
+                problem = check_output(fragment, text, final=False)
+                if problem is not None:
+                    break
+            if choice.finish_reason is not None:
+                finish_reason = choice.finish_reason
+    if problem is None:
+        problem = "truncated" if finish_reason == "length" else check_output(fragment, text)
+    return text, finish_reason, usage, problem, first_token
+
+
+def get_response(fragment, client, model=MODEL, max_tokens=MAX_TOKENS, limiter=None, cache=None):
+    """The corrected fragment, streamed; None if no usable correction comes back.
+
+    A truncated completion is retried with twice the ``max_tokens`` (up to
+    MAX_OUTPUT_TOKENS). A short or runaway one is retried once at
+    RETRY_TEMPERATURE; if the retry is short too, the model means it and the
+    shorter correction is kept (but not cached). API errors are retried
+    RETRY_LIMIT times with backoff.
+    """
+    from openai import RateLimitError
+    prompt = USER_PROMPT + fragment
+    key = None
+    if cache is not None:
+        key = cache_key(fragment, model, SYSTEM_PROMPT, USER_PROMPT, TEMPERATURE, max_tokens)
+        cached = cache.get(key)
+        if cached is not None and check_output(fragment, cached) is None:
+            tracing.count("llm_cache_hits")
+            return cached
+
+    # input + an output of roughly the same size
+    estimated = 2 * estimate_tokens(SYSTEM_PROMPT + prompt)
+    attempt = 0
+    rate_limited = 0
+    temperature = TEMPERATURE
+    while attempt < RETRY_LIMIT:
+        # tokens taken from the limiter and not yet reconciled with the real usage
+        reserved = 0
+        if limiter is not None:
+            limiter.acquire(estimated)
+            reserved = estimated
         try:
-            response = client.chat.completions.create(
+            start = time.perf_counter()
+            stream = client.chat.completions.create(
                 model=model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt},
                 ],
-                temperature=0,
+                temperature=temperature,
                 max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
             )
-            return response.choices[0].message.content
+            content, finish_reason, usage, problem, first_token = read_stream(stream, fragment, start)
+            latency = time.perf_counter() - start
+            # an aborted stream never gets to its usage chunk
+            prompt_tokens = usage.prompt_tokens if usage else estimate_tokens(SYSTEM_PROMPT + prompt)
+            completion_tokens = usage.completion_tokens if usage else estimate_tokens(content)
+            if limiter is not None:
+                limiter.record_usage(reserved, prompt_tokens + completion_tokens)
+                reserved = 0
+            tracing.count("llm_calls")
+            tracing.count("prompt_tokens", prompt_tokens)
+            tracing.count("completion_tokens", completion_tokens)
+            tracing.event("llm_call", latency_s=round(latency, 3),
+                          first_token_s=round(first_token, 3) if first_token is not None else None,
+                          prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                          finish_reason=finish_reason, problem=problem)
+            if problem is None:
+                if cache is not None:
+                    cache.put(key, content)
+                return content
+            tracing.count(f"llm_{problem}")
+            logging.warning(f"Output {problem} ({len(content.split())} words for {len(fragment.split())}, "
+                            f"max_tokens={max_tokens}, temperature={temperature})")
+            if problem == "truncated" and max_tokens < MAX_OUTPUT_TOKENS:
+                max_tokens = min(2 * max_tokens, MAX_OUTPUT_TOKENS)
+            elif problem != "truncated" and temperature == TEMPERATURE:
+                temperature = RETRY_TEMPERATURE
+            elif problem == "short":
+                logging.warning("Keeping the shorter correction")
+                return content
+            else:
+                break
+        except RateLimitError as e:
+            if reserved:
+                # a rejected request uses no tokens
+                limiter.record_usage(reserved, 0)
+            tracing.count("llm_rate_limited")
+            rate_limited += 1
+            if rate_limited > RATE_LIMIT_RETRIES:
+                break
+            delay = retry_after(e, rate_limited)
+            logging.warning(f"Rate limited, backing off {delay:.1f}s")
+            if limiter is not None:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
         except Exception as e:
+            if reserved:
+                limiter.record_usage(reserved, 0)
+            tracing.count("llm_errors")
             logging.warning(f"API error on attempt {attempt + 1}: {e}")
             time.sleep(2 ** attempt)  # Exponential backoff
-    logging.error("Max retries reached for a fragment.")
-    return fragment
+            attempt += 1
+    logging.error("Giving up on a fragment: no usable correction.")
+    return None
 
 
 def split_latex_fragments(text):
@@ -71,47 +250,279 @@ def split_latex_fragments(text):
     return [x for x in out if x.strip()]
 
 
-def main(input_path):
+MATH_ENVS = r"equation|align|alignat|gather|multline|flalign|eqnarray|displaymath|math|array|[pbvBV]?matrix|cases"
+# commands whose arguments are never natural language
+NON_TEXT_COMMANDS = (
+    "documentclass", "usepackage", "includegraphics", "graphicspath", "label", "ref", "eqref",
+    "pageref", "cite", "url", "begin", "end", "newfontfamily", "IfFontExistsTF",
+    "setDefaultTransitions", "setdefaultlanguage", "setotherlanguages", "ce",
+)
+
+_COMMENT_RE = re.compile(r"(?<!\\)%.*")
+_MATH_RE = re.compile(
+    r"\$\$.*?\$\$|\\\[.*?\\\]|\\\(.*?\\\)|(?<!\\)\$.*?(?<!\\)\$"
+    r"|\\begin\{(" + MATH_ENVS + r")\*?\}.*?\\end\{\1\*?\}",
+    re.S,
+)
+_NON_TEXT_RE = re.compile(
+    r"\\(?:" + "|".join(NON_TEXT_COMMANDS) + r")\b\*?(?:\s*\[[^\]]*\])*(?:\s*\{[^{}]*\})*"
+)
+_COMMAND_RE = re.compile(r"\\[A-Za-z@]+\*?")
+_WORD_RE = re.compile(r"[^\W\d_]{2,}")
+
+
+def skip_reason(fragment):
+    """Why ``fragment`` has nothing for the LLM to proofread, or None if it has prose.
+
+    Math, comments, preamble and non-text commands (labels, refs, graphics...)
+    are stripped and the remaining natural-language words are counted.
+    """
+    text = _COMMENT_RE.sub("", fragment)
+    preamble = "\\documentclass" in text or "\\usepackage" in text
+    if "\\begin{document}" in text:
+        text = text.split("\\begin{document}", 1)[1]
+    elif preamble:
+        return "preamble"
+    no_math = _MATH_RE.sub(" ", text)
+    prose = _COMMAND_RE.sub(" ", _NON_TEXT_RE.sub(" ", no_math))
+    if len(_WORD_RE.findall(prose)) >= MIN_PROSE_WORDS:
+        return None
+    if preamble:
+        return "preamble"
+    if no_math != text:
+        return "math"
+    if "\\includegraphics" in text:
+        return "figure"
+    return "markup"
+
+
+_ENV_RE = re.compile(r"\\(begin|end)\{([^}]*)\}")
+# \[ and \] delimiters, but not the \\[4pt] row spacing of align / array
+_DISPLAY_OPEN_RE = re.compile(r"(?<!\\)\\\[")
+_DISPLAY_CLOSE_RE = re.compile(r"(?<!\\)\\\]")
+
+
+def split_oversized(fragment, target_tokens=TARGET_TOKENS):
+    """Split ``fragment`` at line breaks that are outside any environment or display math.
+
+    The pieces concatenate back to ``fragment`` exactly. A block that cannot be
+    split safely is kept whole even if it is over budget.
+    """
+    pieces = []
+    buf = ""
+    depth = 0
+    display = False
+    for line in fragment.splitlines(keepends=True):
+        if buf and depth == 0 and not display and estimate_tokens(buf + line) > target_tokens:
+            pieces.append(buf)
+            buf = ""
+        buf += line
+        for kind, name in _ENV_RE.findall(line):
+            if name != "document":
+                depth += 1 if kind == "begin" else -1
+        depth = max(depth, 0)
+        display ^= (len(_DISPLAY_OPEN_RE.findall(line)) - len(_DISPLAY_CLOSE_RE.findall(line))) % 2 == 1
+        display ^= line.count("$$") % 2 == 1
+    if buf:
+        pieces.append(buf)
+    return pieces
+
+
+def is_boundary(fragment, size, boundary_tokens=BOUNDARY_TOKENS):
+    """Whether a pack may end after ``fragment``, decided by its content alone.
+
+    The chance is proportional to the fragment's ``size`` in tokens, so packs
+    average about ``boundary_tokens`` whatever the paragraph lengths.
+    """
+    digest = hashlib.sha256(fragment.strip().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") < size / boundary_tokens * 2 ** 64
+
+
+def pack_fragments(fragments, target_tokens=TARGET_TOKENS, min_tokens=MIN_PACK_TOKENS,
+                   boundary_tokens=BOUNDARY_TOKENS):
+    """Merge adjacent small prose fragments and split oversized ones, up to ``target_tokens``.
+
+    Packs end at content-defined boundaries (see ``is_boundary``) once they
+    have ``min_tokens``, or when the next fragment would not fit, so editing
+    one paragraph changes its own pack and leaves the others (and their
+    cache keys) alone. Fragments without prose stay on their own so they are
+    still skipped. ``"".join(pack_fragments(f)) == "".join(f)``.
+    """
+    units = []
+    buf = ""
+    buf_size = 0
+    for frag in fragments:
+        size = estimate_tokens(frag)
+        if skip_reason(frag) is not None or size > target_tokens:
+            if buf:
+                units.append(buf)
+                buf, buf_size = "", 0
+            units.extend([frag] if size <= target_tokens else split_oversized(frag, target_tokens))
+            continue
+        if buf and buf_size + size > target_tokens:
+            units.append(buf)
+            buf, buf_size = "", 0
+        buf += frag
+        buf_size += size
+        if buf_size >= min_tokens and is_boundary(frag, size, boundary_tokens):
+            units.append(buf)
+            buf, buf_size = "", 0
+    if buf:
+        units.append(buf)
+    return units
+
+
+def proofread_fragment(i, frag, client, limiter, cache=None):
+    """The corrected fragment, or None if it could not be corrected."""
+    start = time.perf_counter()
+    corrected = get_response(frag, client, limiter=limiter, cache=cache)
+    tracing.event("fragment", index=i, latency_s=round(time.perf_counter() - start, 3),
+                  chars=len(frag), tokens=estimate_tokens(frag), failed=corrected is None)
+    if corrected is None:
+        logging.warning(f"No usable correction for fragment {i+1}, keeping it unchanged")
+    elif corrected == frag:
+        logging.warning(f"No change for fragment {i+1}")
+    return corrected
+
+
+def proofread_fragments(fragments, client, concurrency=CONCURRENCY,
+                        rpm=REQUESTS_PER_MINUTE, tpm=TOKENS_PER_MINUTE, cache=None, journal=None, out=None):
+    """Proofread ``fragments`` concurrently; the result keeps the input order.
+
+    Each fragment is sent without its surrounding whitespace, which is put back
+    afterwards, so ``"".join`` of the result rebuilds the document layout exactly.
+    Fragments without prose (see ``skip_reason``) are passed through verbatim.
+    "Correcting fragment i/N" is logged as fragments complete, with ``i``
+    counting finished fragments so the bot's progress bar only moves forward.
+    With a ``Journal`` every corrected fragment is logged as soon as it is
+    done, and fragments already in the journal are not sent again. Fragments
+    that could not be corrected are kept unchanged and not journaled, so a
+    rerun retries them. With an ``out`` file the document is written to it in
+    order as it is corrected: each fragment as soon as it and all the ones
+    before it are done.
+    """
+    limiter = RateLimiter(rpm, tpm)
+    results = {}
+    jobs = []
+    padding = {}
+    skipped = Counter()
+    for i, frag in enumerate(fragments):
+        core = frag.strip()
+        reason = skip_reason(core) if core else "empty"
+        if reason is None:
+            start = frag.index(core)
+            padding[i] = (frag[:start], frag[start + len(core):])
+            jobs.append((i, core))
+        else:
+            skipped[reason] += 1
+            tracing.count(f"skipped_{reason}")
+            results[i] = frag
+    if skipped:
+        details = ", ".join(f"{n} {reason}" for reason, n in sorted(skipped.items()))
+        logging.info(f"Skipping {sum(skipped.values())}/{len(fragments)} fragments without prose ({details})")
+    if journal is not None:
+        pending = []
+        for i, core in jobs:
+            text = journal.get(i, core)
+            if text is None:
+                pending.append((i, core))
+            else:
+                results[i] = padding[i][0] + text.strip() + padding[i][1]
+        if len(pending) < len(jobs):
+            logging.info(f"Resuming: {len(jobs) - len(pending)}/{len(jobs)} fragments found in the journal")
+            tracing.count("journal_hits", len(jobs) - len(pending))
+    else:
+        pending = jobs
+    total = len(jobs)
+    done = total - len(pending)
+    # the same count the bot's progress bar shows
+    logging.info(f"Total fragments: {total}")
+    progress.emit("total", total=total)
+    lock = threading.Lock()
+
+    def run(i, frag):
+        nonlocal done
+        corrected = proofread_fragment(i, frag, client, limiter, cache)
+        if corrected is None:
+            corrected = frag
+        elif journal is not None:
+            journal.append(i, frag, corrected)
+        with lock:
+            done += 1
+            logging.info(f"Correcting fragment {done}/{total}...")
+            progress.emit("fragment", done=done, total=total)
+        return corrected
+
+    with ThreadPoolExecutor(max(1, concurrency)) as pool:
+        futures = {i: pool.submit(run, i, frag) for i, frag in pending}
+        for i in range(len(fragments)):
+            if i in futures:
+                lead, trail = padding[i]
+                results[i] = lead + futures[i].result().strip() + trail
+            if out is not None:
+                out.write(results[i])
+                out.flush()
+    return [results[i] for i in sorted(results)]
+
+
+def main(input_path, concurrency=CONCURRENCY, rpm=REQUESTS_PER_MINUTE, tpm=TOKENS_PER_MINUTE, base_url=None,
+         use_cache=True, output_path=None, journal_path=None):
+    """Proofread ``input_path`` into ``output_path`` (default ``corrected_<name>`` in the CWD).
+
+    The corrected document grows in ``<output_path>.part`` as fragments finish
+    and replaces ``output_path`` once complete. With ``journal_path`` finished
+    fragments are journaled as they complete and a rerun after a crash only
+    sends the rest. Returns the output path, or None if no API key is
+    configured.
+    """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         logging.error("OPENAI_API_KEY not set in environment.")
-        return
-    client = OpenAI(api_key=api_key)
+        return None
+    from openai import OpenAI
+    # retries and 429 backoff are handled in get_response
+    client = OpenAI(api_key=api_key, base_url=base_url or os.getenv("OPENAI_BASE_URL"), max_retries=0)
 
-    base_name = os.path.basename(input_path)
-    output_path = f"corrected_{base_name}"
+    if output_path is None:
+        output_path = f"corrected_{os.path.basename(input_path)}"
 
     with open(input_path, "r", encoding="utf-8") as f:
         content = f.read()
 
     logging.info("Splitting LaTeX document into fragments...")
     fragments = split_latex_fragments(content)
-    logging.info(f"Total fragments: {len(fragments)}")
+    units = pack_fragments(fragments)
+    logging.info(f"Packed {len(fragments)} fragments into {len(units)} requests of up to ~{TARGET_TOKENS} tokens")
 
-    corrected_fragments = []
-    for i, frag in enumerate(fragments):
-        frag = frag.strip("\n")
-        if not frag:
-            continue
-        logging.info(f"Correcting fragment {i+1}/{len(fragments)}...")
-        corrected = get_response(frag, client)
-        if corrected == frag:
-            logging.warning(f"No change or API error for fragment {i+1}")
-        if len(corrected.split()) < 0.7 * len(frag.split()):
-            logging.error(f"Fragment {i+1} may be truncated. Input length: {len(frag)}, Output length: {len(corrected)}")
-        corrected_fragments.append(corrected)
-        time.sleep(RATE_LIMIT_SECONDS)
-
-    corrected_content = "\n\n".join(corrected_fragments)
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(corrected_content)
-    logging.info(f"Corrected file saved as {output_path}")
+    cache = ProofreadCache() if use_cache else None
+    journal = Journal(journal_path) if journal_path else None
+    part_path = output_path + ".part"
+    logging.info(f"Writing corrected fragments to {part_path} as they finish")
+    try:
+        with open(part_path, "w", encoding="utf-8") as out:
+            proofread_fragments(units, client, concurrency, rpm, tpm, cache, journal, out)
+    finally:
+        if cache is not None:
+            logging.info(f"Proofread cache: {cache.stats()}")
+            cache.close()
+        if journal is not None:
+            journal.close()
 
+    os.replace(part_path, output_path)
+    logging.info(f"Corrected file saved as {output_path}")
+    return output_path
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Grammatical correction for LaTeX via OpenAI API.")
     parser.add_argument("input_file", help="Path to the LaTeX .tex file")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Parallel API requests")
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="Requests per minute limit")
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help="Tokens per minute limit")
+    parser.add_argument("--base_url", help="OpenAI-compatible API base URL (e.g. a local mock server)")
+    parser.add_argument("--no_cache", action="store_true", help="Don't read or write the proofreading cache")
+    parser.add_argument("--output", help="Corrected .tex path (default: corrected_<name> in the current directory)")
+    parser.add_argument("--journal", help="Fragment journal; rerunning with the same journal resumes the run")
     args = parser.parse_args()
-    main(args.input_file)
+    main(args.input_file, args.concurrency, args.rpm, args.tpm, args.base_url, not args.no_cache,
+         args.output, args.journal)
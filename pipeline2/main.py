@@ -1,13 +1,22 @@
 import os
-import sys
-import tempfile
+import json
 import zipfile
 import shutil
+import time
 
 from preprocessing import preprocess_pdf
 from mathpix import mathpix_pdf_to_tex_zip
+from mathpix_cache import MathpixCache, file_hash
+from checkpoint import WorkDir, DEFAULT_ROOT, text_hash
 from preambula_adder import replace_with_custom_preamble
 from llm_proofread import main as llm_proofread
+import progress
+import tracing
+
+TRACE_DIR = os.getenv("PIPELINE_TRACE_DIR", "traces")
+PREPROCESS_DPI = 300
+PREPROCESS_MODE = "g4"
+PREPROCESS_TARGET_DPI = None
 
 
 def extract_zip(zip_path, extract_dir):
@@ -20,68 +29,127 @@ def extract_zip(zip_path, extract_dir):
     return subfolders[0]
 
 
-def pipeline(input_pdf, app_id, app_key, output_folder="output"):
-    with tempfile.TemporaryDirectory() as tmpdir:
-        print(f"[Step 1] Preprocessing PDF...")
-        preproc_pdf = os.path.join(tmpdir, "preprocessed.pdf")
-        preprocess_pdf(input_pdf, preproc_pdf)
-
-        print(f"[Step 2] Sending to Mathpix for LaTeX conversion...")
-        zip_path = mathpix_pdf_to_tex_zip(preproc_pdf, app_id, app_key, os.path.join(tmpdir, "mathpix.tex.zip"))
-
-        print(f"[Step 3] Extracting Mathpix archive to output folder...")
-        if os.path.exists(output_folder):
-            shutil.rmtree(output_folder)
-        os.makedirs(output_folder, exist_ok=True)
+def step(n, title):
+    print(f"[Step {n}] {title}")
+    progress.emit("step", step=n, title=title)
+
+
+def pipeline(input_pdf, app_id, app_key, output_folder="output", use_cache=True,
+             work_root=DEFAULT_ROOT, keep_work=False, job_id=None):
+    """Run all stages for ``input_pdf``, resuming from its work dir if a previous run stopped.
+
+    Stage artifacts live in ``work_root/<input hash>/`` (``<input hash>-<job_id>/``
+    when a ``job_id`` is given); the dir is removed after a successful run
+    unless ``keep_work`` is set.
+    """
+    tracer = tracing.start_job(os.path.basename(input_pdf))
+    tracer.count("input_bytes", os.path.getsize(input_pdf))
+    work = WorkDir.for_input(input_pdf, work_root, job_id)
+    try:
+        _pipeline(input_pdf, app_id, app_key, output_folder, use_cache, work)
+    except Exception as e:
+        tracer.error = f"{type(e).__name__}: {e}"
+        print(f"Stage artifacts kept in {work.path}; rerun to resume.")
+        raise
+    else:
+        if not keep_work:
+            shutil.rmtree(work.path, ignore_errors=True)
+    finally:
+        trace_path = os.path.join(TRACE_DIR, time.strftime("%Y%m%d-%H%M%S_")
+                                  + os.path.splitext(os.path.basename(input_pdf))[0] + ".json")
+        tracer.write(trace_path)
+        progress.emit("trace", path=trace_path)
+
+
+def _pipeline(input_pdf, app_id, app_key, output_folder, use_cache, work):
+    preproc_pdf = work.file("preprocessed.pdf")
+    inputs = {"pdf": file_hash(input_pdf), "dpi": PREPROCESS_DPI, "mode": PREPROCESS_MODE,
+              "target_dpi": PREPROCESS_TARGET_DPI}
+    # the preprocessed PDF's bytes differ per run (Pillow stamps its dates),
+    # so Mathpix results are keyed by the input and the preprocessing settings
+    doc_key = text_hash(json.dumps(inputs, sort_keys=True))
+    zip_path = work.file("mathpix.tex.zip")
+    mathpix_inputs = {"pdf": doc_key}
+    cache = MathpixCache() if use_cache else None
+    if work.done("mathpix", mathpix_inputs):
+        step(1, "Mathpix result found in work dir, skipping preprocessing and upload...")
+    elif cache is not None and cache.get(doc_key, zip_path):
+        step(1, "Mathpix result found in cache, skipping preprocessing and upload...")
+        tracing.count("mathpix_cache_hits")
+        work.complete("mathpix", mathpix_inputs, [zip_path])
+    else:
+        if work.done("preprocess", inputs):
+            step(1, "Preprocessed PDF found in work dir, skipping...")
+        else:
+            step(1, "Preprocessing PDF...")
+            with tracing.span("preprocess"):
+                preprocess_pdf(input_pdf, preproc_pdf, dpi=PREPROCESS_DPI, mode=PREPROCESS_MODE,
+                               target_dpi=PREPROCESS_TARGET_DPI)
+                tracing.count("preprocessed_bytes", os.path.getsize(preproc_pdf))
+            work.complete("preprocess", inputs, [preproc_pdf])
+
+        step(2, "Sending to Mathpix for LaTeX conversion...")
+        with tracing.span("mathpix"):
+            mathpix_pdf_to_tex_zip(preproc_pdf, app_id, app_key, zip_path, cache=cache, cache_key=doc_key)
+        work.complete("mathpix", mathpix_inputs, [zip_path])
+
+    step(3, "Extracting Mathpix archive to output folder...")
+    if os.path.exists(output_folder):
+        shutil.rmtree(output_folder)
+    os.makedirs(output_folder, exist_ok=True)
+    with tracing.span("extract"):
         mathpix_subfolder = extract_zip(zip_path, output_folder)
 
-        orig_tex_files = [f for f in os.listdir(mathpix_subfolder) if f.endswith('.tex')]
-        if not orig_tex_files:
-            raise RuntimeError("No .tex file found inside the Mathpix output folder.")
-        orig_tex_path = os.path.join(mathpix_subfolder, orig_tex_files[0])
-
-        print(f"[Step 4] Adding custom LaTeX preamble...")
-        preamble_tex_path = os.path.join(tmpdir, "with_preamble.tex")
-        replace_with_custom_preamble(orig_tex_path, preamble_tex_path)
-
-        print(f"[Step 5] Proofreading LaTeX file with LLM...")
-        llm_proofread(preamble_tex_path)
-
-        corrected_dir = os.path.dirname(preamble_tex_path)
-        candidates = [os.path.join(corrected_dir, f)
-                      for f in os.listdir(corrected_dir)
-                      if f.startswith("corrected_") and f.endswith(".tex")]
-        candidates += [os.path.join(os.getcwd(), f)
-                       for f in os.listdir(os.getcwd())
-                       if f.startswith("corrected_") and f.endswith(".tex")]
-
-        if not candidates:
-            raise RuntimeError("No corrected .tex file produced by LLM step.")
-        corrected_tex = candidates[0]
-
-        shutil.copy(corrected_tex, orig_tex_path)
-        print(f"All done! Your output is in the folder:\n  {mathpix_subfolder}\nwith corrected .tex and all assets.")
-
-        for f in os.listdir(output_folder):
-            path = os.path.join(output_folder, f)
-            if f.endswith('.tex') and os.path.isfile(path):
-                os.remove(path)
-            if f.endswith('.zip') and os.path.isfile(path):
-                os.remove(path)
-
-        for c in candidates:
-            try:
-                os.remove(c)
-            except Exception:
-                pass
+    orig_tex_files = [f for f in os.listdir(mathpix_subfolder) if f.endswith('.tex')]
+    if not orig_tex_files:
+        raise RuntimeError("No .tex file found inside the Mathpix output folder.")
+    orig_tex_path = os.path.join(mathpix_subfolder, orig_tex_files[0])
+
+    step(4, "Adding custom LaTeX preamble...")
+    preamble_tex_path = work.file("with_preamble.tex")
+    inputs = {"tex": file_hash(orig_tex_path)}
+    if not work.done("preamble", inputs):
+        with tracing.span("preamble"):
+            replace_with_custom_preamble(orig_tex_path, preamble_tex_path)
+        work.complete("preamble", inputs, [preamble_tex_path])
+
+    corrected_tex = work.file("corrected.tex")
+    inputs = {"tex": work.output_hash("preamble", "with_preamble.tex")}
+    if work.done("proofread", inputs):
+        step(5, "Proofread file found in work dir, skipping...")
+    else:
+        step(5, "Proofreading LaTeX file with LLM...")
+        with tracing.span("proofread"):
+            if llm_proofread(preamble_tex_path, use_cache=use_cache, output_path=corrected_tex,
+                             journal_path=work.file("proofread.journal.jsonl")) is None:
+                raise RuntimeError("No corrected .tex file produced by LLM step.")
+        work.complete("proofread", inputs, [corrected_tex])
+
+    shutil.copy(corrected_tex, orig_tex_path)
+    progress.emit("done")
+    print(f"All done! Your output is in the folder:\n  {mathpix_subfolder}\nwith corrected .tex and all assets.")
+
+    for f in os.listdir(output_folder):
+        path = os.path.join(output_folder, f)
+        if f.endswith('.tex') and os.path.isfile(path):
+            os.remove(path)
+        if f.endswith('.zip') and os.path.isfile(path):
+            os.remove(path)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python main.py input.pdf [output_folder]")
-        sys.exit(1)
+    import argparse
+    parser = argparse.ArgumentParser(description="PDF -> preprocessed scan -> Mathpix LaTeX -> LLM proofreading")
+    parser.add_argument("input_pdf", help="Input PDF")
+    parser.add_argument("output_folder", nargs="?", default="output", help="Where the corrected LaTeX goes")
+    parser.add_argument("--work_dir", default=DEFAULT_ROOT,
+                        help="Root of per-job work dirs; an interrupted run resumes from here")
+    parser.add_argument("--keep_work", action="store_true", help="Keep the work dir after a successful run")
+    parser.add_argument("--no_cache", action="store_true", help="Don't use the Mathpix / proofreading caches")
+    parser.add_argument("--job_id", help="Give this job its own work dir, for runs that share an input")
+    args = parser.parse_args()
 
     app_id = os.getenv("MATHPIX_APP_ID")
     app_key = os.getenv("MATHPIX_APP_KEY")
-    output_folder = sys.argv[2] if len(sys.argv) > 2 else "output"
-    pipeline(sys.argv[1], app_id, app_key, output_folder)
+    pipeline(args.input_pdf, app_id, app_key, args.output_folder, not args.no_cache,
+             args.work_dir, args.keep_work, args.job_id)
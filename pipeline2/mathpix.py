@@ -1,46 +1,214 @@
-import requests
+import os
+import re
 import time
+import hashlib
+import shutil
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
+from mathpix_cache import file_hash
+import tracing
 
-def mathpix_pdf_to_tex_zip(pdf_file, app_id, app_key, output_zip=None):
-    url = 'https://api.mathpix.com/v3/pdf'
-    headers = {'app_id': app_id, 'app_key': app_key}
+API_URL = os.getenv("MATHPIX_API_URL", "https://api.mathpix.com/v3/pdf")
+CHUNK_PAGES = 20
+MAX_PARALLEL = 4
+POLL_START = 1.0
+POLL_MAX = 15.0
+POLL_FACTOR = 1.5
 
+
+def make_session(app_id, app_key, pool_size=MAX_PARALLEL):
+    """A keep-alive session shared by every upload, poll and download of a conversion."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.headers.update({'app_id': app_id, 'app_key': app_key})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def submit_pdf(session, pdf_file, url=API_URL):
     with open(pdf_file, 'rb') as file:
-        files = {'file': file}
-        response = requests.post(url, files=files, headers=headers)
-        response_data = response.json()
+        response = session.post(url, files={'file': file})
+    tracing.count("mathpix_calls")
+    tracing.count("bytes_uploaded", os.path.getsize(pdf_file))
+    response_data = response.json()
+
+    if response.status_code != 200 or 'pdf_id' not in response_data:
+        raise RuntimeError(f"Error uploading PDF: {response_data.get('error', 'Unknown error')}")
+    pdf_id = response_data['pdf_id']
+    print(f"PDF uploaded successfully. PDF ID: {pdf_id}")
+    return pdf_id
 
-        if response.status_code != 200 or 'pdf_id' not in response_data:
-            raise RuntimeError(f"Error uploading PDF: {response_data.get('error', 'Unknown error')}")
-        pdf_id = response_data['pdf_id']
-        print(f"PDF uploaded successfully. PDF ID: {pdf_id}")
 
+def wait_for_pdf(session, pdf_id, url=API_URL):
+    """Poll until the conversion is done, backing off from POLL_START to POLL_MAX seconds."""
     status_url = f"{url}/{pdf_id}"
+    delay = POLL_START
     while True:
-        status_response = requests.get(status_url, headers=headers)
-        status_data = status_response.json()
+        status_data = session.get(status_url).json()
+        tracing.count("mathpix_calls")
         status = status_data.get('status')
         if status == 'completed':
             print("PDF conversion completed.")
-            break
+            return
         elif status == 'error':
             raise RuntimeError(f"Error during processing: {status_data.get('error')}")
         else:
             print("Processing... please wait.")
-            time.sleep(5)
+            time.sleep(delay)
+            delay = min(POLL_MAX, delay * POLL_FACTOR)
 
-    tex_zip_url = f"{url}/{pdf_id}.tex"
-    zip_response = requests.get(tex_zip_url, headers=headers)
 
-    if zip_response.status_code == 200:
-        zip_filename = output_zip if output_zip else f"{pdf_id}.tex.zip"
+def download_tex_zip(session, pdf_id, zip_filename, url=API_URL):
+    tracing.count("mathpix_calls")
+    with session.get(f"{url}/{pdf_id}.tex", stream=True) as zip_response:
+        if zip_response.status_code != 200:
+            raise RuntimeError(f"Failed to download LaTeX zip: {zip_response.status_code}")
         with open(zip_filename, "wb") as f:
-            f.write(zip_response.content)
-        print(f"LaTeX zip file saved as {zip_filename}")
-        return zip_filename
-    else:
-        raise RuntimeError(f"Failed to download LaTeX zip: {zip_response.status_code}")
+            for block in zip_response.iter_content(chunk_size=1 << 16):
+                f.write(block)
+                tracing.count("bytes_downloaded", len(block))
+    return zip_filename
+
+
+def convert_pdf(session, pdf_file, zip_filename=None, url=API_URL, cache=None, key=None):
+    """Convert one PDF; with a MathpixCache, identical PDFs (or chunks) are converted only once.
+
+    ``key`` identifies the PDF's content for the cache; by default it is the
+    hash of the file's bytes.
+    """
+    if cache is not None:
+        key = key or file_hash(pdf_file)
+        if zip_filename and cache.get(key, zip_filename):
+            print(f"Using cached Mathpix result for {os.path.basename(pdf_file)}")
+            tracing.count("mathpix_cache_hits")
+            return key[:16], zip_filename
+    pdf_id = submit_pdf(session, pdf_file, url)
+    wait_for_pdf(session, pdf_id, url)
+    zip_filename = download_tex_zip(session, pdf_id, zip_filename or f"{pdf_id}.tex.zip", url)
+    if cache is not None:
+        cache.put(key, zip_filename)
+    return pdf_id, zip_filename
+
+
+def split_pdf(pdf_file, chunk_pages, out_dir):
+    """Split ``pdf_file`` into files of at most ``chunk_pages`` pages (needs pypdf)."""
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        print("pypdf is not installed, sending the PDF in one piece.")
+        return [pdf_file]
+
+    reader = PdfReader(pdf_file)
+    n_pages = len(reader.pages)
+    if n_pages <= chunk_pages:
+        return [pdf_file]
+
+    chunks = []
+    for start in range(0, n_pages, chunk_pages):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + chunk_pages]:
+            writer.add_page(page)
+        path = os.path.join(out_dir, f"chunk_{len(chunks):03d}.pdf")
+        with open(path, "wb") as f:
+            writer.write(f)
+        chunks.append(path)
+    return chunks
+
+
+def _read_tex_zip(zip_path, extract_dir):
+    """Extract a Mathpix tex zip and return (tex_path, images_dir)."""
+    with zipfile.ZipFile(zip_path) as zf:
+        zf.extractall(extract_dir)
+    for root, dirs, files in os.walk(extract_dir):
+        for fname in files:
+            if fname.endswith(".tex"):
+                return os.path.join(root, fname), os.path.join(root, "images")
+    raise RuntimeError(f"No .tex file found in {zip_path}")
+
+
+def merge_tex_zips(zip_paths, output_zip, name):
+    """Join per-chunk Mathpix zips into one ``name/name.tex`` + ``name/images`` zip."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        out_dir = os.path.join(tmpdir, "merged", name)
+        out_images = os.path.join(out_dir, "images")
+        os.makedirs(out_images)
+
+        preamble, bodies = None, []
+        for idx, zip_path in enumerate(zip_paths):
+            tex_path, images_dir = _read_tex_zip(zip_path, os.path.join(tmpdir, f"chunk_{idx}"))
+            with open(tex_path, encoding="utf-8") as f:
+                tex = f.read()
+            head, sep, body = tex.partition("\\begin{document}")
+            if not sep:
+                head, body = "", tex
+            body = body.split("\\end{document}", 1)[0]
+            if preamble is None:
+                preamble = head + sep
+
+            if os.path.isdir(images_dir):
+                for fname in sorted(os.listdir(images_dir)):
+                    target = fname
+                    if os.path.exists(os.path.join(out_images, target)):
+                        # same image name in two chunks: rename this chunk's copy
+                        target = f"c{idx}_{fname}"
+                        stem, new_stem = os.path.splitext(fname)[0], os.path.splitext(target)[0]
+                        body = re.sub(re.escape(stem) + r"(?=[.}])", new_stem, body)
+                    shutil.copy(os.path.join(images_dir, fname), os.path.join(out_images, target))
+            bodies.append(body.strip("\n"))
+
+        with open(os.path.join(out_dir, f"{name}.tex"), "w", encoding="utf-8") as f:
+            f.write(preamble + "\n" + "\n\n".join(bodies) + "\n\\end{document}\n")
+
+        archive = shutil.make_archive(os.path.join(tmpdir, "merged_zip"), "zip",
+                                      root_dir=os.path.join(tmpdir, "merged"))
+        shutil.move(archive, output_zip)
+    return output_zip
+
+
+def chunk_key(cache_key, chunk_pages, index):
+    """Cache key of chunk ``index`` of the document with key ``cache_key``."""
+    return hashlib.sha256(f"{cache_key}:{chunk_pages}:{index}".encode("ascii")).hexdigest()
+
+
+def mathpix_pdf_to_tex_zip(pdf_file, app_id, app_key, output_zip=None,
+                           chunk_pages=CHUNK_PAGES, max_parallel=MAX_PARALLEL, url=API_URL, cache=None,
+                           cache_key=None):
+    """Convert ``pdf_file`` with Mathpix and save the LaTeX zip.
+
+    PDFs longer than ``chunk_pages`` are split and the chunks are converted
+    concurrently over one pooled session, then merged back into a single
+    document with the same zip layout Mathpix produces. With ``cache`` each
+    chunk is looked up before it is uploaded, by ``cache_key`` (and the chunk
+    number) if given, else by the hash of its bytes. Pass a ``cache_key`` for
+    PDFs that are regenerated per run, since their bytes change every time;
+    the whole document's zip is then stored under it as well, so callers can
+    look the document up before generating the PDF at all.
+    """
+    session = make_session(app_id, app_key, max_parallel)
+    with session, tempfile.TemporaryDirectory() as tmpdir:
+        chunks = split_pdf(pdf_file, chunk_pages, tmpdir)
+        if len(chunks) == 1:
+            pdf_id, zip_filename = convert_pdf(session, pdf_file, output_zip, url, cache, cache_key)
+        else:
+            print(f"Submitting {len(chunks)} chunks of up to {chunk_pages} pages...")
+            with ThreadPoolExecutor(max_parallel) as pool:
+                futures = [pool.submit(convert_pdf, session, chunk,
+                                       os.path.join(tmpdir, f"chunk_{i:03d}.tex.zip"), url, cache,
+                                       chunk_key(cache_key, chunk_pages, i) if cache_key else None)
+                           for i, chunk in enumerate(chunks)]
+                results = [f.result() for f in futures]
+            pdf_id = results[0][0]
+            zip_filename = output_zip if output_zip else f"{pdf_id}.tex.zip"
+            merge_tex_zips([z for _, z in results], zip_filename, pdf_id)
+            if cache is not None and cache_key:
+                cache.put(cache_key, zip_filename)
+    print(f"LaTeX zip file saved as {zip_filename}")
+    return zip_filename
 
 
 if __name__ == "__main__":
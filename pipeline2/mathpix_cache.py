@@ -0,0 +1,86 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+DEFAULT_DIR = os.getenv(
+    "MATHPIX_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "coursework2025", "mathpix"),
+)
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class MathpixCache:
+    """Content-addressed store of Mathpix tex zips, keyed by the SHA-256 of the submitted PDF
+    or a key the caller derives from the document it came from.
+
+    Entries expire ``ttl`` seconds after they were stored, and the oldest
+    entries are dropped once the store grows past ``max_bytes``. Writes go
+    through a temp file + rename, so concurrent bot jobs can share the store.
+    """
+
+    def __init__(self, root=DEFAULT_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.tex.zip")
+
+    def get(self, key, dest):
+        """Copy the cached zip for ``key`` to ``dest``; False on a miss or expired entry."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return False
+            shutil.copy(path, dest)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key, src):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        shutil.copy(src, tmp)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for dirpath, _, files in os.walk(self.root):
+            for fname in files:
+                if not fname.endswith(".tex.zip"):
+                    continue
+                path = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(path)
+                    if now - st.st_mtime > self.ttl:
+                        os.remove(path)
+                    else:
+                        entries.append((st.st_mtime, st.st_size, path))
+                except FileNotFoundError:
+                    pass
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
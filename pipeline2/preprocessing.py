@@ -1,45 +1,105 @@
-import cv2
-from pdf2image import convert_from_path
-from PIL import Image
 import os
+from collections import deque
+from functools import partial
 
 
-def preprocess_pdf(input_pdf, output_pdf, dpi=300):
-    pages = convert_from_path(input_pdf, dpi=dpi)
-    processed_images = []
+def iter_pages(input_pdf, dpi=300, chunk_size=4, thread_count=2):
+    """Render ``input_pdf`` lazily, ``chunk_size`` pages at a time, as grayscale arrays."""
+    import cv2
+    import numpy as np
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    n_pages = pdfinfo_from_path(input_pdf)["Pages"]
+    for first in range(1, n_pages + 1, chunk_size):
+        last = min(first + chunk_size - 1, n_pages)
+        pages = convert_from_path(input_pdf, dpi=dpi, first_page=first, last_page=last,
+                                  thread_count=thread_count)
+        for page in pages:
+            yield cv2.cvtColor(np.asarray(page.convert("RGB")), cv2.COLOR_RGB2GRAY)
 
-    for i, page in enumerate(pages):
-        img_path = f'page_{i}.png'
-        page.save(img_path, 'PNG')
 
-        image = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+def binarize(image):
+    import cv2
+    blurred = cv2.GaussianBlur(image, (5, 5), 0)
 
-        blurred = cv2.GaussianBlur(image, (5, 5), 0)
+    adaptive_threshold = cv2.adaptiveThreshold(
+        blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY, 11, 2
+    )
+    return adaptive_threshold
 
-        adaptive_threshold = cv2.adaptiveThreshold(
-            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
 
-        processed_image = Image.fromarray(adaptive_threshold)
-        processed_images.append(processed_image)
+def process_page(image, scale=1.0):
+    """Binarize a grayscale page, then optionally shrink the black/white result by ``scale``."""
+    import cv2
+    binary = binarize(image)
+    if scale < 1.0:
+        h, w = binary.shape
+        small = cv2.resize(binary, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        _, binary = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY)
+    return binary
 
-        os.remove(img_path)
 
-    processed_images[0].save(
-        output_pdf,
-        save_all=True,
-        append_images=processed_images[1:],
-        resolution=100.0,
-        quality=95
-    )
+def to_pil(page, mode="g4"):
+    """``g4``: 1-bit image, written by Pillow as a CCITT G4 stream; ``gray``: 8-bit as before."""
+    from PIL import Image
+    image = Image.fromarray(page)
+    if mode == "g4":
+        return image.convert("1", dither=Image.Dither.NONE)
+    return image
+
+
+def bounded_map(pool, fn, items, window):
+    """Like ``pool.map`` but with at most ``window`` items in flight, results in order."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def preprocess_pdf(input_pdf, output_pdf, dpi=300, workers=None, mode="g4", target_dpi=None):
+    """Binarize every page of ``input_pdf`` into ``output_pdf``.
+
+    ``mode`` is ``"g4"`` (1-bit CCITT G4, lossless for the thresholded pages
+    and far smaller) or ``"gray"`` (8-bit pages). ``target_dpi`` below ``dpi``
+    downscales the binarized pages before they are written.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    out_dpi = min(target_dpi or dpi, dpi)
+    pages = iter_pages(input_pdf, dpi=dpi, chunk_size=workers, thread_count=min(workers, 4))
+
+    n = 0
+    with ProcessPoolExecutor(workers) as pool:
+        work = partial(process_page, scale=out_dpi / dpi)
+        for processed in bounded_map(pool, work, pages, window=2 * workers):
+            processed_image = to_pil(processed, mode)
+            # the G4 encoder rejects JPEG options
+            extra = {"quality": 95} if mode == "gray" else {}
+            # pages are appended to the PDF as they finish, nothing is kept in memory
+            processed_image.save(
+                output_pdf,
+                format="PDF",
+                append=n > 0,
+                resolution=float(out_dpi),
+                **extra
+            )
+            n += 1
     print(f"Saved preprocessed PDF as {output_pdf}")
 
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) not in [3, 4]:
-        print("Usage: python preprocessing.py input.pdf output.pdf [dpi]")
-    else:
-        dpi = int(sys.argv[3]) if len(sys.argv) == 4 else 300
-        preprocess_pdf(sys.argv[1], sys.argv[2], dpi=dpi)
+    import argparse
+    parser = argparse.ArgumentParser(description="Binarize a scanned PDF before sending it to Mathpix.")
+    parser.add_argument("input_pdf")
+    parser.add_argument("output_pdf")
+    parser.add_argument("dpi", nargs="?", type=int, default=300, help="Render DPI")
+    parser.add_argument("--mode", choices=["g4", "gray"], default="g4", help="Page encoding")
+    parser.add_argument("--target_dpi", type=int, help="Downscale binarized pages to this DPI")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all CPUs)")
+    args = parser.parse_args()
+    preprocess_pdf(args.input_pdf, args.output_pdf, dpi=args.dpi, workers=args.workers,
+                   mode=args.mode, target_dpi=args.target_dpi)
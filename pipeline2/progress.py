@@ -0,0 +1,90 @@
+"""Structured progress channel between the pipeline and the bot.
+
+The pipeline calls ``emit()``; when ``PIPELINE_PROGRESS=json`` is set (the bot
+sets it for its subprocess) every event is printed to stdout as one line:
+``@progress {"event": "fragment", "done": 3, "total": 40}``. The bot reads the
+events back with ``parse()`` and shows them through a throttled
+``ProgressMessage`` instead of editing the Telegram message on every line.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+
+PREFIX = "@progress "
+_lock = threading.Lock()
+
+
+def emit(event, **fields):
+    if os.getenv("PIPELINE_PROGRESS") != "json":
+        return
+    line = PREFIX + json.dumps({"event": event, **fields}, ensure_ascii=False)
+    with _lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def parse(line):
+    """The event dict of a progress line, or None for ordinary log output."""
+    if not line.startswith(PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PREFIX):])
+    except ValueError:
+        return None
+
+
+class ProgressMessage:
+    """A Telegram status message that is edited at most once per ``interval`` seconds.
+
+    Updates arriving faster are coalesced: only the newest text is sent when
+    the interval is up, and an edit that would not change the text is dropped.
+    """
+
+    def __init__(self, bot, chat_id, message_id, interval=3.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self.sent = None
+        self.pending = None
+        self.last_time = 0.0
+        self.timer = None
+
+    async def update(self, text, parse_mode=None):
+        import asyncio
+        self.pending = (text, parse_mode)
+        wait = self.last_time + self.interval - time.monotonic()
+        if wait <= 0:
+            await self._send()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().create_task(self._send_later(wait))
+
+    async def finish(self, text, parse_mode=None):
+        """Send ``text`` right away (final status), dropping anything still pending."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.pending = (text, parse_mode)
+        await self._send()
+
+    async def _send_later(self, wait):
+        import asyncio
+        await asyncio.sleep(wait)
+        self.timer = None
+        await self._send()
+
+    async def _send(self):
+        pending, self.pending = self.pending, None
+        if pending is None or (self.sent is not None and pending[0] == self.sent[0]):
+            return
+        self.sent = pending
+        self.last_time = time.monotonic()
+        text, parse_mode = pending
+        try:
+            await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self.message_id,
+                                             text=text, parse_mode=parse_mode)
+        except Exception as e:
+            logging.warning(f"Progress edit failed: {e}")
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_PATH = os.getenv(
+    "PROOFREAD_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "coursework2025", "proofread.sqlite"),
+)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(fragment, model, system_prompt, user_prompt, temperature, max_tokens):
+    """Hash of everything that determines the model's answer for a fragment."""
+    payload = json.dumps([model, system_prompt, user_prompt, temperature, max_tokens, fragment],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ProofreadCache:
+    """Persistent SQLite cache of proofread fragments with size-based LRU eviction.
+
+    The store's size is kept as a running total, so a ``put`` only scans the
+    table when the total goes over ``max_bytes``. The scan first recounts the
+    total, which also picks up entries written by other processes.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fragments ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS fragments_last_used ON fragments(last_used)")
+        self.db.commit()
+        self.total = self._size()
+
+    def _size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM fragments").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM fragments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE fragments SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            return row[0]
+
+    def put(self, key, value):
+        size = len(key) + len(value.encode("utf-8"))
+        with self.lock:
+            old = self.db.execute("SELECT size FROM fragments WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO fragments (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self.total += size - (old[0] if old else 0)
+            if self.total > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        self.total = self._size()
+        if self.total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM fragments ORDER BY last_used").fetchall():
+            self.db.execute("DELETE FROM fragments WHERE key = ?", (key,))
+            self.total -= size
+            if self.total <= self.max_bytes:
+                break
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
+
+    def close(self):
+        with self.lock:
+            self.db.close()
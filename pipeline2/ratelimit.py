@@ -0,0 +1,59 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``per_minute`` units per minute.
+
+    ``reserve`` always takes the units (the bucket may go into debt) and returns
+    how long the caller has to wait, so concurrent callers queue up fairly
+    instead of racing for the next refill.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount):
+        with self.lock:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits plus a shared 429 pause."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self.lock:
+            wait = max(wait, self.paused_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_usage(self, estimated, actual):
+        """Correct the token bucket once the real usage of a request is known."""
+        if actual > estimated:
+            self.tokens.reserve(actual - estimated)
+        elif actual < estimated:
+            self.tokens.refund(estimated - actual)
+
+    def pause(self, seconds):
+        """Hold back every caller for ``seconds`` (e.g. after a 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
@@ -0,0 +1,75 @@
+"""Aggregate trace JSON files written by main.py into a per-stage summary.
+
+    python trace_report.py traces/*.json [--json]
+"""
+import sys
+import json
+import argparse
+from collections import defaultdict
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(traces):
+    durations = defaultdict(list)
+    rss = defaultdict(list)
+    counters = defaultdict(lambda: defaultdict(int))
+    for trace in traces:
+        for s in trace["spans"]:
+            durations[s["name"]].append(s["duration_s"])
+            rss[s["name"]].append(max(s["peak_rss_mb"], s.get("children_peak_rss_mb", 0)))
+            for k, v in s["counters"].items():
+                counters[s["name"]][k] += v
+    stages = {}
+    for name, values in durations.items():
+        stages[name] = {
+            "jobs": len(values),
+            "mean_s": sum(values) / len(values),
+            "p50_s": percentile(values, 0.5),
+            "p95_s": percentile(values, 0.95),
+            "max_s": max(values),
+            "max_peak_rss_mb": max(rss[name]),
+            "counters": dict(counters[name]),
+        }
+    totals = [t["duration_s"] for t in traces]
+    return {
+        "jobs": len(traces),
+        "total_p50_s": percentile(totals, 0.5),
+        "total_p95_s": percentile(totals, 0.95),
+        "stages": stages,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Summarize pipeline traces")
+    p.add_argument("traces", nargs="+", help="Trace JSON files")
+    p.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = p.parse_args()
+
+    traces = []
+    for path in args.traces:
+        with open(path, encoding="utf-8") as f:
+            traces.append(json.load(f))
+    summary = summarize(traces)
+
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+        return
+    print(f"{summary['jobs']} jobs, total p50 {summary['total_p50_s']:.1f}s, p95 {summary['total_p95_s']:.1f}s")
+    print(f"{'stage':<14}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}{'rss MB':>9}  counters")
+    for name, s in summary["stages"].items():
+        counters = ", ".join(f"{k}={v}" for k, v in s["counters"].items())
+        print(f"{name:<14}{s['mean_s']:>9.2f}{s['p50_s']:>9.2f}{s['p95_s']:>9.2f}{s['max_s']:>9.2f}"
+              f"{s['max_peak_rss_mb']:>9.0f}  {counters}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Per-job stage tracing for pipeline2.
+
+    tracer = tracing.start_job("lecture.pdf")
+    with tracing.span("preprocess"):
+        ...
+    tracing.count("bytes_uploaded", n)
+    tracing.event("llm_call", latency_s=0.8, prompt_tokens=312)
+    tracer.write("traces/lecture.json")
+
+Spans run one after another in the main thread; counters and events may come
+from worker threads and are attributed to every span open at that moment.
+``trace_report.py`` aggregates the written JSON files.
+"""
+import os
+import json
+import time
+import resource
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class Tracer:
+    def __init__(self, job=None):
+        self.job = job
+        self.started = time.time()
+        self.spans = []
+        self.events = []
+        self.counters = Counter()
+        self.error = None
+        self._open = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        record = {"name": name, "counters": Counter()}
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        with self._lock:
+            self._open.append(record)
+        try:
+            yield record
+        finally:
+            with self._lock:
+                self._open.remove(record)
+            record["duration_s"] = time.perf_counter() - start
+            record["peak_rss_mb"] = peak_rss_mb()
+            record["peak_rss_growth_mb"] = record["peak_rss_mb"] - rss_before
+            record["children_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+            self.spans.append(record)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+            for record in self._open:
+                record["counters"][name] += n
+
+    def event(self, name, **fields):
+        with self._lock:
+            stage = self._open[-1]["name"] if self._open else None
+            self.events.append({"name": name, "stage": stage, "t": time.time() - self.started, **fields})
+
+    def to_dict(self):
+        return {
+            "job": self.job,
+            "started": self.started,
+            "duration_s": time.time() - self.started,
+            "error": self.error,
+            "peak_rss_mb": peak_rss_mb(),
+            "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "counters": dict(self.counters),
+            "spans": [{**s, "counters": dict(s["counters"])} for s in self.spans],
+            "events": self.events,
+        }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        return path
+
+
+_current = Tracer()
+
+
+def start_job(job):
+    global _current
+    _current = Tracer(job)
+    return _current
+
+
+def current():
+    return _current
+
+
+def span(name):
+    return _current.span(name)
+
+
+def count(name, n=1):
+    _current.count(name, n)
+
+
+def event(name, **fields):
+    _current.event(name, **fields)
@@ -0,0 +1,67 @@
+"""Pages in shared memory for multi-process region recognition.
+
+The page is converted BGR -> RGB once, straight into a
+``multiprocessing.shared_memory`` block, and worker processes get only a
+small ``ref`` (block name, shape) plus a bbox. They map the block and
+slice their region out of it as a NumPy view, so nothing page-sized is
+pickled or copied per region and worker memory stays flat.
+
+    with SharedPage(bgr_page) as page:
+        futures = [pool.submit(ocr_region, page.ref, det["bbox"]) for det in text_dets]
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# block name -> SharedMemory mapped by this worker process
+_attached = {}
+
+
+class SharedPage:
+    """An RGB copy of a BGR page in shared memory; unlinked when the ``with`` block ends."""
+
+    def __init__(self, img):
+        import cv2
+        self.shm = shared_memory.SharedMemory(create=True, size=img.nbytes)
+        self.array = np.ndarray(img.shape, dtype=np.uint8, buffer=self.shm.buf)
+        cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=self.array)
+        self.ref = (self.shm.name, img.shape)
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def page_view(ref):
+    """The page behind ``ref`` as a read-only array, mapping the block on first use."""
+    name, shape = ref
+    shm = _attached.get(name)
+    if shm is None:
+        # one page at a time: drop the previous page's mapping
+        for old in _attached.values():
+            old.close()
+        _attached.clear()
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    view.flags.writeable = False
+    return view
+
+
+def region(ref, bbox):
+    """Zero-copy view of ``bbox = (x1, y1, x2, y2)`` on the shared page."""
+    x1, y1, x2, y2 = bbox
+    return page_view(ref)[y1:y2, x1:x2]
+
+
+def ocr_region(ref, bbox):
+    """Tesseract on one region of a shared page; runs in a worker process."""
+    from merging import ocr_text
+    return ocr_text(region(ref, bbox))
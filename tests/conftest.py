@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "pipeline2")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
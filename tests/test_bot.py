@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from jobs import JobQueue
+
+PIPELINE2 = os.path.dirname(os.path.abspath(bot.__file__))
+
+# stands in for main.py: logs when it runs, reports progress, fails on request
+STUB_PIPELINE = f"""
+import os, sys, time
+sys.path.insert(0, {PIPELINE2!r})
+import progress
+from checkpoint import work_dir_path
+
+input_path, output_folder = sys.argv[1], sys.argv[2]
+job_id = sys.argv[sys.argv.index("--job_id") + 1]
+with open("runs.log", "a") as f:
+    f.write(f"start {{job_id}} {{time.time()}}\\n")
+work = work_dir_path(input_path, job_id=job_id)
+os.makedirs(work)
+progress.emit("step", step=1, title="Preprocessing PDF...")
+progress.emit("step", step=5, title="Proofreading LaTeX file with LLM...")
+progress.emit("total", total=2)
+for done in (1, 2):
+    progress.emit("fragment", done=done, total=2)
+time.sleep(0.3)
+with open("runs.log", "a") as f:
+    f.write(f"end {{job_id}} {{time.time()}}\\n")
+with open(input_path) as f:
+    if "fail" in f.read():
+        print("RuntimeError: Mathpix is down", flush=True)
+        sys.exit(1)
+os.makedirs(os.path.join(output_folder, "doc"))
+with open(os.path.join(output_folder, "doc", "doc.tex"), "w") as f:
+    f.write("\\\\begin{{document}}x\\\\end{{document}}\\n")
+os.rmdir(work)
+"""
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits = {}
+        self.documents = {}
+
+    async def edit_message_text(self, chat_id, message_id, text, parse_mode=None):
+        self.edits.setdefault(message_id, []).append(text)
+
+    async def send_document(self, chat_id, document, filename=None):
+        self.documents.setdefault(chat_id, []).append(filename or os.path.basename(document.name))
+
+    async def send_message(self, chat_id, text):
+        self.documents.setdefault(chat_id, []).append(text)
+
+
+class FakeCompiler:
+    timeout = 60
+
+    async def compile(self, tex_dir, tex_file, log_path):
+        pdf_path = os.path.join(tex_dir, tex_file.rsplit(".", 1)[0] + ".pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4")
+        return SimpleNamespace(pdf_path=pdf_path, returncode=0, timed_out=False, seconds=0.1)
+
+
+async def run_workers(queue, fake_bot, pipeline_cmd, workers=2, deadline=30):
+    wake = asyncio.Event()
+    shown = {}
+    tasks = [asyncio.create_task(bot.worker(fake_bot, queue, wake, shown, pipeline_cmd, 1, FakeCompiler()))
+             for _ in range(workers)]
+    wake.set()
+    start = time.monotonic()
+    try:
+        while queue.db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]:
+            assert time.monotonic() - start < deadline, "jobs did not finish"
+            await asyncio.sleep(0.05)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def runs_log():
+    times = {}
+    with open("runs.log") as f:
+        for line in f:
+            kind, job_id, t = line.split()
+            times[(kind, int(job_id))] = float(t)
+    return times
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bot, "PROGRESS_INTERVAL", 0)
+    (tmp_path / "stub_main.py").write_text(STUB_PIPELINE)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    yield queue
+    queue.close()
+
+
+def enqueue(queue, user_id, message_id, content):
+    path = f"input_{message_id}.pdf"
+    with open(path, "w") as f:
+        f.write(content)
+    return queue.enqueue(user_id, user_id * 10, path, file_name=path, message_id=message_id)
+
+
+def test_worker_runs_jobs_per_user_in_order_and_reports_them(queue):
+    a1 = enqueue(queue, 1, 101, "first")
+    a2 = enqueue(queue, 1, 102, "fail")
+    b1 = enqueue(queue, 2, 201, "other user")
+    fake_bot = FakeBot()
+
+    asyncio.run(run_workers(queue, fake_bot, [sys.executable, "stub_main.py"]))
+
+    status = {r["id"]: (r["status"], r["error"]) for r in queue.db.execute("SELECT id, status, error FROM jobs")}
+    assert status[a1] == ("done", None)
+    assert status[b1] == ("done", None)
+    assert status[a2][0] == "failed" and "Mathpix is down" in status[a2][1]
+
+    # one job per user at a time; the other user's job ran alongside
+    times = runs_log()
+    assert times[("start", a2)] >= times[("end", a1)]
+    assert times[("start", b1)] < times[("end", a1)]
+
+    edits = fake_bot.edits[101]
+    assert edits[0] == "Starting processing…"
+    assert "[Step 1] Preprocessing PDF..." in edits
+    assert any("2/2 (100%)" in e for e in edits)
+    assert edits[-1].startswith("✓ Processing complete")
+    assert fake_bot.edits[102][-1].startswith("⛔") and "Mathpix is down" in fake_bot.edits[102][-1]
+    assert not any(e.startswith("✓") for e in fake_bot.edits[102])
+
+    # zip + PDF for each finished job, nothing for the failed one
+    assert len(fake_bot.documents[10]) == 2
+    assert len(fake_bot.documents[20]) == 2
+
+    # inputs, outputs and work dirs are cleaned up, also for the failed job
+    leftovers = [f for f in os.listdir() if f.startswith(("input_", "output_"))]
+    assert leftovers == []
+    assert os.listdir("work") == []
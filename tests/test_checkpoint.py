@@ -0,0 +1,53 @@
+import os
+
+from checkpoint import WorkDir, Journal
+
+
+def test_jobs_on_the_same_input_get_their_own_work_dirs(tmp_path):
+    pdf = tmp_path / "notes.pdf"
+    pdf.write_bytes(b"%PDF-1.4 same file")
+    shared = WorkDir.for_input(str(pdf), str(tmp_path))
+    first = WorkDir.for_input(str(pdf), str(tmp_path), job_id=1)
+    second = WorkDir.for_input(str(pdf), str(tmp_path), job_id=2)
+
+    assert len({shared.path, first.path, second.path}) == 3
+    assert WorkDir.for_input(str(pdf), str(tmp_path), job_id=1).path == first.path
+
+
+def test_journal_repairs_a_torn_last_line(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    journal.append(0, "first", "FIRST")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"index": 1, "source": "ab')
+
+    journal = Journal(path)
+    assert journal.get(0, "first") == "FIRST"
+    journal.append(1, "second", "SECOND")
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.get(0, "first") == "FIRST"
+    assert journal.get(1, "second") == "SECOND"
+    assert len(journal) == 2
+    journal.close()
+
+
+def test_stage_is_done_only_with_same_inputs_and_intact_outputs(tmp_path):
+    work = WorkDir(str(tmp_path / "job"))
+    out = work.file("out.txt")
+    with open(out, "w") as f:
+        f.write("result")
+    work.complete("stage", {"pdf": "abc", "dpi": 300}, [out])
+
+    resumed = WorkDir(str(tmp_path / "job"))
+    assert resumed.done("stage", {"pdf": "abc", "dpi": 300})
+    assert not resumed.done("stage", {"pdf": "abc", "dpi": 200})
+    assert not resumed.done("other", {"pdf": "abc", "dpi": 300})
+
+    with open(out, "w") as f:
+        f.write("changed")
+    assert not resumed.done("stage", {"pdf": "abc", "dpi": 300})
+    os.remove(out)
+    assert not resumed.done("stage", {"pdf": "abc", "dpi": 300})
@@ -0,0 +1,72 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import itertools
+
+import crop_cache
+import model_client
+import model_server
+
+
+class FakeModels:
+    def __init__(self, weights):
+        self.weights = weights
+
+    def names(self):
+        return ["pix2tex (onnx)", "tesseract"]
+
+    def describe(self):
+        return {"backend": "onnx", "weights": self.weights,
+                "versions": {"pix2tex": "0.1.4", "tesseract": "5.3.0"}}
+
+
+def serve(models):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), model_server.make_handler(models))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_remote_tag_names_the_servers_backend_and_weights():
+    tags = []
+    for weights in ("aaaa", "bbbb"):
+        server = serve(FakeModels(weights))
+        try:
+            remote = model_client.connect(f"http://127.0.0.1:{server.server_port}")
+            tags.append(crop_cache.model_tag(remote, 0))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    assert tags == ["pix2tex-0.1.4/onnx/aaaa", "pix2tex-0.1.4/onnx/bbbb"]
+
+
+def test_store_evicts_least_recently_used_past_max_bytes(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(crop_cache.time, "time", lambda: next(clock))
+    path = str(tmp_path / "crops.sqlite")
+    cache = crop_cache.CropCache(path, memory_items=0, max_bytes=3 * (4 + 100))
+    for key in ("key0", "key1", "key2"):
+        cache.put(key, "x" * 100)
+    assert cache.get("key0") is not None
+    cache.put("key3", "x" * 100)
+    cache.close()
+
+    cache = crop_cache.CropCache(path, memory_items=0)
+    assert [cache.get(k) is not None for k in ("key0", "key1", "key2", "key3")] == [True, False, True, True]
+    cache.close()
+
+
+def test_store_keeps_a_running_size(tmp_path, monkeypatch):
+    path = str(tmp_path / "crops.sqlite")
+    cache = crop_cache.CropCache(path, memory_items=0, max_bytes=3 * (4 + 100))
+    scans = []
+    size = cache._size
+    monkeypatch.setattr(cache, "_size", lambda: scans.append(1) or size())
+    cache.put_many([("key0", "x" * 100), ("key1", "x" * 100)])
+    cache.put("key0", "x" * 10)
+    assert (cache.total, scans) == ((4 + 100) + (4 + 10), [])
+    cache.close()
+
+    cache = crop_cache.CropCache(path, memory_items=0)
+    assert cache.total == (4 + 100) + (4 + 10)
+    cache.close()
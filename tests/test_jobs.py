@@ -0,0 +1,64 @@
+import pytest
+
+from jobs import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    yield queue
+    queue.close()
+
+
+def test_jobs_are_claimed_in_fifo_order(queue):
+    ids = [queue.enqueue(user, 100 + user, f"in{user}.pdf") for user in (1, 2, 3)]
+    claimed = [queue.claim()["id"] for _ in ids]
+    assert claimed == ids
+    assert queue.claim() is None
+
+
+def test_claim_skips_users_at_their_limit(queue):
+    a1 = queue.enqueue(1, 10, "a1.pdf")
+    a2 = queue.enqueue(1, 10, "a2.pdf")
+    b1 = queue.enqueue(2, 20, "b1.pdf")
+
+    assert queue.claim()["id"] == a1
+    assert queue.claim()["id"] == b1
+    assert queue.claim() is None
+    assert [j["id"] for j in queue.queued()] == [a2]
+
+    queue.finish(a1)
+    assert queue.claim()["id"] == a2
+
+
+def test_per_user_limit_allows_parallel_jobs(queue):
+    ids = [queue.enqueue(1, 10, f"{i}.pdf") for i in range(3)]
+    assert [queue.claim(per_user_limit=2)["id"] for _ in range(2)] == ids[:2]
+    assert queue.claim(per_user_limit=2) is None
+
+
+def test_finish_records_status_and_error(queue):
+    ok = queue.enqueue(1, 10, "ok.pdf")
+    bad = queue.enqueue(2, 20, "bad.pdf")
+    queue.claim()
+    queue.claim()
+    queue.finish(ok)
+    queue.finish(bad, error="Mathpix timeout")
+
+    rows = {r["id"]: r for r in queue.db.execute("SELECT id, status, error FROM jobs")}
+    assert (rows[ok]["status"], rows[ok]["error"]) == ("done", None)
+    assert (rows[bad]["status"], rows[bad]["error"]) == ("failed", "Mathpix timeout")
+
+
+def test_running_jobs_are_requeued_after_a_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(path)
+    first = queue.enqueue(1, 10, "first.pdf")
+    second = queue.enqueue(2, 20, "second.pdf")
+    queue.claim()
+    queue.close()
+
+    queue = JobQueue(path)
+    assert [j["id"] for j in queue.queued()] == [first, second]
+    assert queue.claim()["id"] == first
+    queue.close()
@@ -0,0 +1,50 @@
+import os
+import asyncio
+
+import latex_compile
+
+DOC = ("\\documentclass{article}\n\\usepackage{amsmath}\n\\csname endofdump\\endcsname\n"
+       "\\usepackage{fontspec}\n\\begin{document}\nHello\n\\end{document}\n")
+
+
+class FakeEngine:
+    """Stands in for ``CompileService._run``: builds formats, and fails every compile that uses one."""
+
+    def __init__(self):
+        self.runs = []
+
+    async def __call__(self, args, cwd, log_path, env=None):
+        kind = "build" if "-ini" in args else "format" if any(a.startswith("-fmt=") for a in args) else "cold"
+        self.runs.append(kind)
+        if kind == "build":
+            name = next(a for a in args if a.startswith("-jobname=")).split("=", 1)[1]
+            open(os.path.join(cwd, name + ".fmt"), "wb").close()
+        elif kind == "cold":
+            open(os.path.join(cwd, "doc.pdf"), "wb").close()
+            return 0, False
+        return (0 if kind == "build" else 1), False
+
+
+def test_broken_format_falls_back_to_a_cold_compile_and_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(latex_compile, "engine_version", lambda: "XeTeX 3.14")
+    doc_dir = tmp_path / "doc"
+    doc_dir.mkdir()
+    (doc_dir / "doc.tex").write_text(DOC)
+    service = latex_compile.CompileService(workers=1, format_dir=str(tmp_path / "formats"))
+    engine = FakeEngine()
+    monkeypatch.setattr(service, "_run", engine)
+
+    def compile_doc():
+        return asyncio.run(service.compile(str(doc_dir), "doc.tex", str(doc_dir / "doc.log")))
+
+    result = compile_doc()
+    assert result.ok and not result.used_format
+    assert engine.runs == ["build", "format", "cold"]
+    assert not [f for f in os.listdir(tmp_path / "formats") if f.endswith(".fmt")]
+
+    # rebuilt on the next compile; broken again, so it is dropped
+    compile_doc()
+    assert engine.runs[3:] == ["build", "format", "cold"]
+    result = compile_doc()
+    assert result.ok
+    assert engine.runs[6:] == ["cold"]
@@ -0,0 +1,39 @@
+import numpy as np
+
+import layout
+
+TITLE = (100, 50, 900, 100)
+FOOTER = (100, 900, 900, 950)
+# the columns' row gaps (50 px) line up and are wider than the gutter (40 px)
+LEFT = [(100, 150, 480, 300), (100, 350, 480, 500), (100, 550, 480, 700)]
+RIGHT = [(520, 150, 900, 300), (520, 350, 900, 500), (520, 550, 900, 700)]
+
+
+def test_xy_cut_reads_aligned_columns_one_after_the_other():
+    boxes = np.array([TITLE, LEFT[0], RIGHT[0], LEFT[1], RIGHT[1], LEFT[2], RIGHT[2], FOOTER])
+    names = ["title", "L1", "R1", "L2", "R2", "L3", "R3", "footer"]
+    order = [names[i] for i in layout.xy_cut(boxes)]
+    assert order == ["title", "L1", "L2", "L3", "R1", "R2", "R3", "footer"]
+
+
+def test_xy_cut_single_column_top_to_bottom():
+    boxes = np.array([LEFT[2], LEFT[0], LEFT[1]])
+    assert layout.xy_cut(boxes).tolist() == [1, 2, 0]
+
+
+def test_dedupe_keeps_equation_inside_less_confident_paragraph():
+    boxes = np.array([(100, 100, 900, 400), (300, 200, 500, 240)])
+    rows = np.array([[1, 0, 0, 0, 0, 0.5], [0, 0, 0, 0, 0, 0.9]], dtype=np.float32)
+    assert layout.dedupe(rows, boxes).tolist() == [0, 1]
+
+
+def test_dedupe_drops_box_contained_in_larger_one_of_same_class():
+    boxes = np.array([(100, 100, 900, 400), (300, 200, 500, 240)])
+    rows = np.array([[1, 0, 0, 0, 0, 0.5], [1, 0, 0, 0, 0, 0.9]], dtype=np.float32)
+    assert layout.dedupe(rows, boxes).tolist() == [0]
+
+
+def test_dedupe_drops_less_confident_duplicate_of_any_class():
+    boxes = np.array([(100, 100, 900, 400), (105, 102, 898, 405)])
+    rows = np.array([[1, 0, 0, 0, 0, 0.8], [0, 0, 0, 0, 0, 0.6]], dtype=np.float32)
+    assert layout.dedupe(rows, boxes).tolist() == [0]
@@ -0,0 +1,203 @@
+from types import SimpleNamespace
+
+import pytest
+
+import llm_proofread
+from checkpoint import Journal
+
+
+class FakeStream:
+    def __init__(self, text, finish_reason="stop"):
+        words = text.split(" ")
+        self.chunks = [self._chunk(w if i == 0 else " " + w) for i, w in enumerate(words)]
+        self.chunks.append(self._chunk(None, finish_reason))
+
+    @staticmethod
+    def _chunk(content, finish_reason=None):
+        choice = SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)
+        return SimpleNamespace(usage=None, choices=[choice])
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeClient:
+    """Upper-cases fragments, except that ``fail`` fragments raise an API error.
+
+    ``reply(fragment, max_tokens, temperature)`` can return another
+    ``(text, finish_reason)`` instead.
+    """
+
+    def __init__(self, fail=(), reply=None):
+        self.fail = set(fail)
+        self.reply = reply
+        self.sent = []
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, max_tokens, temperature, **kw):
+        fragment = messages[-1]["content"][len(llm_proofread.USER_PROMPT):]
+        self.sent.append(fragment)
+        self.requests.append((max_tokens, temperature))
+        if fragment in self.fail:
+            raise RuntimeError("server error")
+        if self.reply is not None:
+            return FakeStream(*self.reply(fragment, max_tokens, temperature))
+        return FakeStream(fragment.upper())
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_proofread.time, "sleep", lambda s: None)
+
+
+FRAGMENTS = ["The first paragraph has some words.\n\n",
+             "The second paragraph fails to correct.\n\n",
+             "The third paragraph has some words."]
+
+
+def test_failed_fragments_are_not_journaled(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    client = FakeClient(fail={FRAGMENTS[1].strip()})
+    out = llm_proofread.proofread_fragments(FRAGMENTS, client, journal=journal)
+    journal.close()
+
+    assert out == [FRAGMENTS[0].upper(), FRAGMENTS[1], FRAGMENTS[2].upper()]
+    assert len(client.sent) == 2 + llm_proofread.RETRY_LIMIT
+
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    client = FakeClient()
+    out = llm_proofread.proofread_fragments(FRAGMENTS, client, journal=journal)
+    journal.close()
+
+    assert client.sent == [FRAGMENTS[1].strip()]
+    assert out == [f.upper() for f in FRAGMENTS]
+
+
+def make_document(n=80, seed=0):
+    import random
+    rng = random.Random(seed)
+    words = ["lecture", "theorem", "proof", "function", "value", "limit", "series", "space",
+             "matrix", "the", "of", "is", "and", "a", "we", "that", "this", "for", "set"]
+    # equal-sized paragraphs: the worst case for packing by size alone
+    return [" ".join(rng.choice(words) for _ in range(60)) + ".\n\n" for _ in range(n)]
+
+
+def test_inserting_a_paragraph_keeps_the_later_packs():
+    fragments = make_document()
+    packs = llm_proofread.pack_fragments(fragments)
+    edited = fragments[:7] + make_document(1, seed=1) + fragments[7:]
+    edited_packs = llm_proofread.pack_fragments(edited)
+
+    assert "".join(edited_packs) == "".join(edited)
+    assert all(llm_proofread.estimate_tokens(p) <= llm_proofread.TARGET_TOKENS for p in edited_packs)
+    assert len(packs) > 5
+    assert len(set(packs) - set(edited_packs)) == 1
+    assert edited_packs[-10:] == packs[-10:]
+
+
+SENTENCE = "one two three four five six seven eight nine ten"
+
+
+def test_truncated_output_is_retried_with_more_tokens():
+    def reply(fragment, max_tokens, temperature):
+        if max_tokens < 4 * llm_proofread.MAX_TOKENS:
+            return fragment[:10], "length"
+        return fragment, "stop"
+
+    client = FakeClient(reply=reply)
+    assert llm_proofread.get_response(SENTENCE, client) == SENTENCE
+    assert [m for m, _ in client.requests] == [2048, 4096, 8192]
+
+
+def test_truncated_output_gives_up_at_the_token_cap():
+    client = FakeClient(reply=lambda f, m, t: (f[:10], "length"))
+    assert llm_proofread.get_response(SENTENCE, client) is None
+    assert client.requests[-1][0] == llm_proofread.MAX_OUTPUT_TOKENS
+
+
+def test_short_output_is_retried_once_at_another_temperature_then_kept():
+    client = FakeClient(reply=lambda f, m, t: ("one two three", "stop"))
+    assert llm_proofread.get_response(SENTENCE, client) == "one two three"
+    assert [t for _, t in client.requests] == [llm_proofread.TEMPERATURE, llm_proofread.RETRY_TEMPERATURE]
+
+
+def test_runaway_output_is_retried_once_then_given_up():
+    client = FakeClient(reply=lambda f, m, t: (" ".join([f] * 10), "stop"))
+    assert llm_proofread.get_response(SENTENCE, client) is None
+    assert len(client.requests) == 2
+
+
+class RecordingLimiter:
+    """Tracks the tokens a request holds: reserved by acquire, corrected by record_usage."""
+
+    def __init__(self):
+        self.held = 0
+        self.acquired = 0
+        self.paused = []
+
+    def acquire(self, tokens):
+        self.acquired += 1
+        self.held += tokens
+
+    def record_usage(self, estimated, actual):
+        self.held += actual - estimated
+
+    def pause(self, seconds):
+        self.paused.append(seconds)
+
+
+def test_failed_requests_give_their_reserved_tokens_back():
+    import httpx
+    from openai import RateLimitError
+
+    calls = []
+
+    def reply(fragment, max_tokens, temperature):
+        calls.append(fragment)
+        if len(calls) <= 2:
+            response = httpx.Response(429, headers={"retry-after": "0"},
+                                      request=httpx.Request("POST", "http://api.test/v1"))
+            raise RateLimitError("rate limited", response=response, body=None)
+        raise RuntimeError("server error")
+
+    limiter = RecordingLimiter()
+    assert llm_proofread.get_response(SENTENCE, FakeClient(reply=reply), limiter=limiter) is None
+    assert limiter.acquired == 2 + llm_proofread.RETRY_LIMIT
+    assert limiter.paused == [0.0, 0.0]
+    assert limiter.held == 0
+
+
+def test_split_oversized_ignores_row_spacing_inside_align():
+    prose = "A line of ordinary prose about the theorem and its proof.\n"
+    fragment = (prose * 3
+                + "\\begin{align}\n  a &= b \\\\[4pt]\n  c &= d\n\\end{align}\n"
+                + prose * 3
+                + "\\[\n" + "  x = y + z + w + u + v + t + s\n" * 6 + "\\]\n"
+                + prose * 3)
+    pieces = llm_proofread.split_oversized(fragment, target_tokens=30)
+
+    assert "".join(pieces) == fragment
+    # never split inside the align or the display, but still after them
+    for piece in pieces:
+        assert piece.count("\\begin{align}") == piece.count("\\end{align}")
+        assert piece.count("\\[\n") == piece.count("\\]\n")
+    assert len(pieces) > 4
+
+
+def test_log_and_progress_report_the_same_total(monkeypatch, caplog):
+    events = []
+    monkeypatch.setattr(llm_proofread.progress, "emit", lambda event, **f: events.append((event, f)))
+    fragments = FRAGMENTS + ["\\begin{equation}x = 1\\end{equation}\n\n"]
+    with caplog.at_level("INFO"):
+        llm_proofread.proofread_fragments(fragments, FakeClient())
+
+    assert ("total", {"total": 3}) in events
+    assert "Total fragments: 3" in caplog.text
+    assert [f["total"] for e, f in events if e == "fragment"] == [3, 3, 3]
@@ -0,0 +1,95 @@
+import os
+import time
+import zipfile
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import main
+import mathpix
+from mathpix_cache import MathpixCache
+
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch):
+    """Pipeline stages stubbed out (the Mathpix calls below the cache), recording their calls."""
+    calls = SimpleNamespace(preprocessed=[], uploaded=[], proofread=[], fail_proofread=False)
+
+    def preprocess_pdf(input_pdf, output_pdf, **kw):
+        # like the real step, every save stamps a new creation date
+        calls.preprocessed.append(input_pdf)
+        when = time.gmtime(1735689600 + len(calls.preprocessed))
+        Image.new("L", (100, 100), 255).save(output_pdf, creationDate=when, modDate=when)
+
+    def submit_pdf(session, pdf_file, url):
+        calls.uploaded.append(pdf_file)
+        return f"pdf{len(calls.uploaded)}"
+
+    def download_tex_zip(session, pdf_id, zip_filename, url):
+        with zipfile.ZipFile(zip_filename, "w") as z:
+            z.writestr("doc/doc.tex", "\\begin{document}x\\end{document}\n")
+        return zip_filename
+
+    def llm_proofread(input_path, use_cache=True, output_path=None, journal_path=None):
+        calls.proofread.append(input_path)
+        if calls.fail_proofread:
+            raise RuntimeError("LLM is down")
+        with open(input_path) as src, open(output_path, "w") as dst:
+            dst.write(src.read())
+        return output_path
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "preprocess_pdf", preprocess_pdf)
+    monkeypatch.setattr(mathpix, "make_session", lambda *a: contextlib.nullcontext())
+    monkeypatch.setattr(mathpix, "submit_pdf", submit_pdf)
+    monkeypatch.setattr(mathpix, "wait_for_pdf", lambda *a: None)
+    monkeypatch.setattr(mathpix, "download_tex_zip", download_tex_zip)
+    monkeypatch.setattr(main, "llm_proofread", llm_proofread)
+    monkeypatch.setattr(main, "MathpixCache", lambda: MathpixCache(str(tmp_path / "mathpix-cache")))
+    monkeypatch.setattr(main, "TRACE_DIR", str(tmp_path / "traces"))
+    calls.input_pdf = str(tmp_path / "notes.pdf")
+    Image.new("L", (100, 100), 0).save(calls.input_pdf)
+    return calls
+
+
+def run(tmp_path, stages, n, **kw):
+    main.pipeline(stages.input_pdf, "id", "key", output_folder=str(tmp_path / f"out{n}"),
+                  work_root=str(tmp_path / "work"), **kw)
+
+
+def test_identical_runs_hit_mathpix_cache(tmp_path, stages):
+    for n in range(2):
+        run(tmp_path, stages, n)
+
+    assert len(stages.preprocessed) == 1
+    assert len(stages.uploaded) == 1
+    assert os.path.exists(tmp_path / "out1" / "doc" / "doc.tex")
+    # one copy, stored once
+    assert sum(len(files) for _, _, files in os.walk(tmp_path / "mathpix-cache")) == 1
+
+
+def test_failed_run_resumes_after_mathpix(tmp_path, stages):
+    stages.fail_proofread = True
+    with pytest.raises(RuntimeError):
+        run(tmp_path, stages, 0, use_cache=False)
+    assert (len(stages.preprocessed), len(stages.uploaded), len(stages.proofread)) == (1, 1, 1)
+
+    stages.fail_proofread = False
+    run(tmp_path, stages, 1, use_cache=False)
+    assert (len(stages.preprocessed), len(stages.uploaded), len(stages.proofread)) == (1, 1, 2)
+    assert os.path.exists(tmp_path / "out1" / "doc" / "doc.tex")
+    # finished: the work dir is gone
+    assert os.listdir(tmp_path / "work") == []
+
+
+def test_changed_settings_rerun_the_stages(tmp_path, stages, monkeypatch):
+    stages.fail_proofread = True
+    with pytest.raises(RuntimeError):
+        run(tmp_path, stages, 0, use_cache=False)
+
+    monkeypatch.setattr(main, "PREPROCESS_DPI", 200)
+    stages.fail_proofread = False
+    run(tmp_path, stages, 1, use_cache=False)
+    assert (len(stages.preprocessed), len(stages.uploaded)) == (2, 2)
@@ -0,0 +1,59 @@
+import os
+import zipfile
+
+from PIL import Image
+from pypdf import PdfReader
+
+from mathpix import split_pdf, merge_tex_zips
+
+
+def make_pdf(path, pages):
+    images = [Image.new("L", (50, 50 + i), 255) for i in range(pages)]
+    images[0].save(path, save_all=True, append_images=images[1:])
+    return str(path)
+
+
+def make_zip(path, name, body, images):
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr(f"{name}/{name}.tex",
+                   "\\documentclass{article}\n\\begin{document}\n" + body + "\n\\end{document}\n")
+        for fname, data in images.items():
+            z.writestr(f"{name}/images/{fname}", data)
+    return str(path)
+
+
+def test_split_pdf_into_chunks(tmp_path):
+    pdf = make_pdf(tmp_path / "doc.pdf", 5)
+    chunks = split_pdf(pdf, 2, str(tmp_path))
+
+    assert [os.path.basename(c) for c in chunks] == ["chunk_000.pdf", "chunk_001.pdf", "chunk_002.pdf"]
+    assert [len(PdfReader(c).pages) for c in chunks] == [2, 2, 1]
+    heights = [float(p.mediabox.height) for c in chunks for p in PdfReader(c).pages]
+    assert heights == [float(p.mediabox.height) for p in PdfReader(pdf).pages]
+
+
+def test_split_pdf_keeps_short_pdf_whole(tmp_path):
+    pdf = make_pdf(tmp_path / "doc.pdf", 2)
+    assert split_pdf(pdf, 2, str(tmp_path)) == [pdf]
+
+
+def test_merge_tex_zips_renames_colliding_images(tmp_path):
+    first = make_zip(tmp_path / "a.zip", "a", "First \\includegraphics{fig1.jpg} part.",
+                     {"fig1.jpg": b"first"})
+    second = make_zip(tmp_path / "b.zip", "b", "Second \\includegraphics{fig1.jpg} and {fig2}.",
+                      {"fig1.jpg": b"second", "fig2.jpg": b"other"})
+    out = merge_tex_zips([first, second], str(tmp_path / "merged.zip"), "doc")
+
+    with zipfile.ZipFile(out) as z:
+        names = sorted(z.namelist())
+        tex = z.read("doc/doc.tex").decode("utf-8")
+        assert z.read("doc/images/fig1.jpg") == b"first"
+        assert z.read("doc/images/c1_fig1.jpg") == b"second"
+        assert z.read("doc/images/fig2.jpg") == b"other"
+
+    assert "doc/doc.tex" in names
+    assert tex.count("\\documentclass") == 1
+    assert tex.count("\\begin{document}") == 1 and tex.rstrip().endswith("\\end{document}")
+    assert "First \\includegraphics{fig1.jpg} part." in tex
+    assert "Second \\includegraphics{c1_fig1.jpg} and {fig2}." in tex
+    assert tex.index("First") < tex.index("Second")
@@ -0,0 +1,35 @@
+import itertools
+
+import proofread_cache
+
+
+def test_running_total_tracks_replacements_and_reopen(tmp_path):
+    path = str(tmp_path / "proofread.sqlite")
+    cache = proofread_cache.ProofreadCache(path)
+    cache.put("key0", "x" * 100)
+    cache.put("key1", "x" * 100)
+    cache.put("key0", "x" * 10)
+    assert cache.total == (4 + 100) + (4 + 10)
+    cache.close()
+
+    cache = proofread_cache.ProofreadCache(path)
+    assert cache.total == (4 + 100) + (4 + 10)
+    cache.close()
+
+
+def test_put_scans_only_past_max_bytes(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(proofread_cache.time, "time", lambda: next(clock))
+    cache = proofread_cache.ProofreadCache(str(tmp_path / "proofread.sqlite"), max_bytes=3 * (4 + 100))
+    scans = []
+    size = cache._size
+    monkeypatch.setattr(cache, "_size", lambda: scans.append(1) or size())
+    for key in ("key0", "key1", "key2"):
+        cache.put(key, "x" * 100)
+    assert scans == []
+    assert cache.get("key0") is not None
+    cache.put("key3", "x" * 100)
+    assert scans == [1]
+    assert cache.total == 3 * (4 + 100)
+    assert [cache.get(k) is not None for k in ("key0", "key1", "key2", "key3")] == [True, False, True, True]
+    cache.close()
@@ -0,0 +1,87 @@
+import pytest
+
+import ratelimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_up_to_capacity(clock):
+    bucket = ratelimit.TokenBucket(60)
+    assert [bucket.reserve(1) for _ in range(60)] == [0.0] * 60
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = ratelimit.TokenBucket(60, capacity=10)
+    bucket.reserve(10)
+    clock.now += 5
+    assert bucket.reserve(5) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_bucket_never_refills_past_capacity(clock):
+    bucket = ratelimit.TokenBucket(60, capacity=10)
+    clock.now += 1000
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_oversized_reservation_is_capped_at_capacity(clock):
+    bucket = ratelimit.TokenBucket(60, capacity=10)
+    assert bucket.reserve(100) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_refund_gives_units_back(clock):
+    bucket = ratelimit.TokenBucket(60, capacity=10)
+    bucket.reserve(10)
+    bucket.refund(4)
+    assert bucket.reserve(4) == 0.0
+
+
+def test_limiter_waits_for_the_tighter_limit(clock):
+    limiter = ratelimit.RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+    limiter.acquire(6000)
+    assert clock.slept == []
+    limiter.acquire(1200)
+    assert clock.slept == [pytest.approx(12.0)]
+
+
+def test_limiter_corrects_the_estimate_with_actual_usage(clock):
+    limiter = ratelimit.RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+    limiter.acquire(6000)
+    limiter.record_usage(estimated=6000, actual=3000)
+    limiter.acquire(3000)
+    assert clock.slept == []
+    limiter.record_usage(estimated=3000, actual=3600)
+    limiter.acquire(1)
+    assert clock.slept == [pytest.approx(6.01)]
+
+
+def test_pause_holds_back_every_caller(clock):
+    limiter = ratelimit.RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+    limiter.pause(5)
+    limiter.pause(2)
+    limiter.acquire(1)
+    assert clock.slept == [pytest.approx(5.0)]
+    limiter.acquire(1)
+    assert clock.slept == [pytest.approx(5.0)]